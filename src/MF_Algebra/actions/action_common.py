@@ -160,7 +160,8 @@ class substitute_into_(Action):
 
 
 class evaluate_(Action):
-    def __init__(self, preaddress='', mode="random leaf", **kwargs):
+    def __init__(self, preaddress='', mode="random leaf", number_mode=None, **kwargs):
+        self.number_mode = number_mode # see Expression.evaluate
         super().__init__(preaddress=preaddress,**kwargs)
         # if mode == "random leaf":
         #     leaf_addresses = input_expression.get_all_leaf_addresses()
@@ -169,7 +170,7 @@ class evaluate_(Action):
 
     @preaddressfunc
     def get_output_expression(self, input_expression=None):
-        return input_expression.evaluate()
+        return input_expression.evaluate(self.number_mode)
     
     @preaddressmap
     def get_addressmap(self, input_expression=None):
@@ -145,21 +145,29 @@ class Action:
 
 def preaddressfunc(func):
 	def wrapper(action, expr, *args, **kwargs):
-		expr = expr.copy()
 		preaddress = kwargs.get('preaddress', '') or action.preaddress
+		if algebra_config["persistent_trees"]:
+			# Nothing is copied, the output shares everything outside the path to preaddress with expr
+			active_part = expr.get_subex(preaddress)
+			result = func(action, active_part).reset_new_parentheses(active_part)
+			output_expression = expr.replace_at_address(result, preaddress, reset_parentheses=True)
+			output_expression.parentheses = False # it is new either way, so this is safe
+			return output_expression
+		expr = expr.copy()
 		if len(preaddress)==0:
 			output_expression = func(action, expr)
 		else:
 			active_part = expr.get_subex(preaddress)
 			result = func(action, active_part)
-			output_expression = expr.substitute_at_address(result, preaddress)
+			output_expression = expr.replace_at_address(result, preaddress) # expr is already a copy
 		output_expression.reset_parentheses()
 		return output_expression
 	return wrapper
 
 def preaddressmap(getmap):
 	def wrapper(action, expr, *args, **kwargs):
-		expr = expr.copy()
+		if not algebra_config["persistent_trees"]:
+			expr = expr.copy()
 		preaddress = kwargs.get('preaddress', '') or action.preaddress
 		addressmap = getmap(action, expr, *args, **kwargs)
 		if preaddress:
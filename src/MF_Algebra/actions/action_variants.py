@@ -17,13 +17,11 @@ class AlgebraicAction(Action):
     def get_addressmap(self, input_expression=None):
         addressmap = []
         def get_var_ad_dict(template):
-            template_leaves = {
-                template.get_subex(ad)
-                for ad in input_expression.get_all_leaf_addresses()
-                }
             from ..expressions.variables import Variable
-            variables = [var for var in template_leaves if isinstance(var, Variable)]
-            return {var: template.get_addresses_of_subex(var) for var in variables}
+            var_ad_dict = {}
+            for ad, var in template.walk(where=lambda subex: isinstance(subex, Variable)):
+                var_ad_dict.setdefault(var, []).append(ad)
+            return var_ad_dict
         self.template1_address_dict = get_var_ad_dict(self.template1)
         self.template2_address_dict = get_var_ad_dict(self.template2)
         variables = self.template1_address_dict.keys() | self.template2_address_dict.keys()
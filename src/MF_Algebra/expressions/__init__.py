@@ -1,8 +1,10 @@
 from .expression_core import *
+from .flat_tree import *
 from .operations import *
 from .numbers import *
 from .variables import *
 from .functions import *
 from .sequences import *
 from .relations import *
+from .evaluation import *
 from .expression_common import *
\ No newline at end of file
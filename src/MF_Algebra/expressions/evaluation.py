@@ -0,0 +1,276 @@
+from ..utils import Smarten
+from .expression_core import Expression
+from .variables import Variable
+from .sequences import Sequence
+from .functions import Function
+from .operations import Div, Pow
+import numpy as np
+
+
+def as_array(values):
+	# Integer arrays would refuse negative powers, so they become floats like the rest
+	values = np.asarray(values)
+	if values.dtype.kind in "biu":
+		values = values.astype(float)
+	return values
+
+
+def get_dag(expr):
+	"""
+		Each distinct subexpression of expr once, children before parents, as (subex, positions of its children).
+		Subexpressions are told apart by type, get_evaluation_key and their children's positions, so a subtree repeated
+		anywhere in expr, like the a and b in a**2 + 2*a*b + b**2 after substitute, is listed, and so evaluated, only once,
+		while functions written the same but with different rules are not mixed up.
+	"""
+	positions = {} # (type, evaluation key, children's positions) to position
+	node_positions = {} # by id, so a node shared between several places is only visited once
+	dag = []
+	stack = [(expr, False)]
+	while stack:
+		subex, expanded = stack.pop()
+		if id(subex) in node_positions:
+			continue
+		if expanded:
+			children = [node_positions[id(child)] for child in subex.children]
+			key = (type(subex), subex.get_evaluation_key(), tuple(children))
+			if key not in positions:
+				dag.append((subex, children))
+				positions[key] = len(dag) - 1
+			node_positions[id(subex)] = positions[key]
+		else:
+			stack.append((subex, True))
+			stack.extend((child, False) for child in reversed(subex.children))
+	return dag
+
+
+def check_variables(dag, variables):
+	for subex, children in dag:
+		if isinstance(subex, Variable) and subex not in variables:
+			raise ValueError(f"Expression contains a variable {subex.symbol} which is not one of the inputs.")
+
+
+def vectorize(expr, *variables):
+	"""
+		Returns a function of one array per variable which evaluates expr at all of them at once,
+		each node's compute_vectorized working on whole arrays with NumPy's broadcasting.
+		The tree is walked once here to lay out its distinct subexpressions (see get_dag),
+		and each call goes over those once, however many points there are. For example
+
+		F = vectorize(x**2 + sin(x), x)
+		F(np.linspace(0, 1, 10000))
+	"""
+	variables = [Smarten(variable) for variable in variables]
+	dag = get_dag(expr)
+	check_variables(dag, variables)
+	steps = [(None, variables.index(subex)) if isinstance(subex, Variable) else (subex, children) for subex, children in dag]
+
+	def vectorized(*arrays):
+		if len(arrays) != len(variables):
+			raise TypeError(f"Expected {len(variables)} arrays, one for each of {', '.join(map(str, variables))}, but got {len(arrays)}.")
+		arrays = [as_array(array) for array in arrays]
+		values = []
+		for subex, children in steps:
+			if subex is None:
+				values.append(arrays[children])
+			else:
+				values.append(subex.compute_vectorized(*[values[c] for c in children]))
+		# Parts without the variables come out as single numbers, so the result is stretched to the inputs' shape
+		if arrays:
+			return np.broadcast_to(values[-1], np.broadcast(*arrays).shape).copy()
+		return np.asarray(values[-1])
+	return vectorized
+
+
+def compile_expression(expr, variables=None):
+	"""
+		Writes a Python function which gives what expr.compute() would with the variables
+		set to its arguments, one line per distinct subexpression (see get_dag), children first.
+		For example x**2 + sin(x) becomes
+
+		def compiled(v0):
+			t0 = c1(v0, c0)
+			t1 = (v0, )
+			t2 = c2(*t1)
+			t3 = (t0 + t2)
+			return t3
+
+		where c0 is 2, c1 is operations.power and c2 is sin's rule. Running it looks nothing up in the tree.
+		Expression.compile keeps the result so it is only written once.
+	"""
+	if variables is None:
+		variables = list(dict.fromkeys(subex for address, subex in expr.walk(where=lambda subex: isinstance(subex, Variable))))
+	variables = [Smarten(variable) for variable in variables]
+	namespace = {}
+	constant_names = {} # by id, so each rule or number used more than once gets just one name
+	def constant(value):
+		if id(value) not in constant_names:
+			constant_names[id(value)] = f"c{len(namespace)}"
+			namespace[constant_names[id(value)]] = value
+		return constant_names[id(value)]
+	dag = get_dag(expr)
+	check_variables(dag, variables)
+	codes = []
+	lines = []
+	for subex, children in dag:
+		if isinstance(subex, Variable):
+			codes.append(f"v{variables.index(subex)}")
+			continue
+		code = subex.get_code([codes[c] for c in children], constant)
+		if subex.children:
+			name = f"t{len(lines)}"
+			lines.append(f"{name} = {code}")
+			code = name
+		codes.append(code)
+	parameters = ", ".join(f"v{n}" for n in range(len(variables)))
+	source = f"def compiled({parameters}):\n" + "".join(f"\t{line}\n" for line in lines) + f"\treturn {codes[-1]}\n"
+	exec(compile(source, f"<compiled {expr!r}>", "exec"), namespace)
+	compiled = namespace["compiled"]
+	compiled.source = source
+	return compiled
+
+
+
+def evaluate_many(expressions):
+	"""
+		Computes every expression in floating point, carrying on past any that fail.
+		The nodes of all the expressions are pooled, and evaluated in batches of the same operation at the same
+		height above the leaves, each a single operation on columns holding its operands' values for every node in it.
+		So the number of operations done grows with the variety of the expressions, not how many there are.
+		Returns an array of the values, aligned with expressions, and a list of the same length holding None
+		for each expression which computed, or the exception it ran into instead, such as ZeroDivisionError,
+		OverflowError, or ValueError for a variable. Those values are nan.
+	"""
+	values = [] # one per node of every expression, leaves filled in as they are met
+	batches = {} # (height, type, evaluation key, child count, argument counts) to (template, node ids, operand ids, argument counts)
+	errors = [None] * len(expressions)
+	roots = []
+	for row, expr in enumerate(expressions):
+		if not isinstance(expr, Expression):
+			expr = Smarten(expr)
+		roots.append(pool_nodes(expr, row, values, batches, errors))
+	values = np.array(values, dtype=float)
+	# Each expression's nodes run up to and including its root
+	rows = np.repeat(np.arange(len(roots)), np.diff(roots, prepend=-1)) if roots else np.array([], dtype=np.intp)
+	with np.errstate(all="ignore"):
+		for key in sorted(batches, key=lambda key: key[0]):
+			evaluate_batch(*batches[key], values, rows, errors)
+	results = values[roots]
+	results[[error is not None for error in errors]] = np.nan
+	return results, errors
+
+
+def pool_nodes(expr, row, values, batches, errors):
+	# Gives each node of expr an id, the position of its value, and puts every non-leaf into the batch it is evaluated with.
+	# A Sequence gets no id of its own, being only the tuple of its children's ids for the Function it belongs to.
+	# Returns the id of expr, or of a nan put after its nodes if expr is a Sequence.
+	preorder, stack = [], [expr]
+	while stack:
+		subex = stack.pop()
+		preorder.append(subex)
+		stack.extend(subex.children)
+	# Backwards, each node comes right after its children's subtrees, first to last,
+	# so the last entries of finished, and of heights, are its children's when it is reached
+	finished, heights = [], []
+	has_sequences = False
+	for subex in reversed(preorder):
+		children = subex.children
+		if not children and not isinstance(subex, Sequence):
+			finished.append(len(values))
+			heights.append(0)
+			try:
+				values.append(float(subex.compute()))
+			except Exception as error: # a variable, or a number too large for a float
+				values.append(np.nan)
+				if errors[row] is None:
+					errors[row] = error
+			continue
+		split = len(finished) - len(children)
+		operands = finished[split:]
+		height = max(heights[split:], default=0)
+		del finished[split:], heights[split:]
+		if isinstance(subex, Sequence):
+			finished.append(tuple(operands))
+			heights.append(height)
+			has_sequences = True
+			continue
+		height += 1
+		argument_counts = None
+		if has_sequences and tuple in map(type, operands):
+			if not isinstance(subex, Function):
+				if errors[row] is None:
+					errors[row] = ValueError(f"{type(subex).__name__} cannot take a Sequence, only a Function can.")
+				finished.append(len(values))
+				heights.append(height)
+				values.append(np.nan)
+				continue
+			# Functions of the same name can still be given different numbers of arguments
+			argument_counts = tuple(len(operand) if type(operand) is tuple else None for operand in operands)
+			operands = [i for operand in operands for i in (operand if type(operand) is tuple else [operand])]
+		key = (height, type(subex), subex.get_evaluation_key(), len(children), argument_counts)
+		batch = batches.get(key)
+		if batch is None:
+			batch = batches[key] = (subex, [], [], argument_counts)
+		batch[1].append(len(values))
+		batch[2].extend(operands)
+		finished.append(len(values))
+		heights.append(height)
+		values.append(np.nan)
+	if type(finished[0]) is tuple:
+		if errors[row] is None:
+			errors[row] = ValueError("A Sequence has no single value.")
+		values.append(np.nan)
+		return len(values) - 1
+	return finished[0]
+
+
+def evaluate_batch(template, node_ids, operand_ids, argument_counts, values, rows, errors):
+	# Every node of the batch at once, through template's compute_vectorized.
+	# A row first going infinite or nan here, rather than in some operand, gets its error from this node.
+	node_ids = np.array(node_ids, dtype=np.intp)
+	operand_columns = list(values[np.array(operand_ids, dtype=np.intp).reshape(len(node_ids), -1).T])
+	try:
+		values[node_ids] = template.compute_vectorized(*group_arguments(operand_columns, argument_counts))
+	except Exception:
+		# Like a rule that only takes numbers failing on some of them, or a Relation, which has no vectorized form.
+		# Going one node at a time finds which rows the failure belongs to.
+		for n, node_id in enumerate(node_ids):
+			try:
+				values[node_id] = template.compute_vectorized(*group_arguments([column[n] for column in operand_columns], argument_counts))
+			except Exception as error:
+				values[node_id] = np.nan
+				if errors[rows[node_id]] is None:
+					errors[rows[node_id]] = error
+	failed = ~np.isfinite(values[node_ids])
+	for column in operand_columns:
+		failed &= np.isfinite(column)
+	for n in np.flatnonzero(failed):
+		row = rows[node_ids[n]]
+		if errors[row] is None:
+			errors[row] = get_node_error(template, [column[n] for column in operand_columns], values[node_ids[n]])
+
+
+def group_arguments(operand_values, argument_counts):
+	# The operands as compute_vectorized takes them, each Sequence's arguments in a tuple of their own
+	if argument_counts is None:
+		return operand_values
+	grouped, n = [], 0
+	for argument_count in argument_counts:
+		if argument_count is None:
+			grouped.append(operand_values[n])
+			n += 1
+		else:
+			grouped.append(tuple(operand_values[n:n + argument_count]))
+			n += argument_count
+	return grouped
+
+
+def get_node_error(subex, operand_values, value):
+	# What compute would have raised, or the nearest to it, for a node of subex's kind which came out infinite or nan
+	name = type(subex).__name__
+	if isinstance(subex, Div) and 0 in operand_values[1:]:
+		return ZeroDivisionError("Division by zero.")
+	if isinstance(subex, Pow) and operand_values[0] == 0:
+		return ZeroDivisionError("Zero raised to a negative power.")
+	if np.isinf(value):
+		return OverflowError(f"{name} result too large.")
+	return ValueError(f"{name} result undefined.")
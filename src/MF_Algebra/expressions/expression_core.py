@@ -1,7 +1,14 @@
 # expressions.py
-from MF_Tools.dual_compatibility import dc_Tex as Tex, MANIM_TYPE, VGroup
-from ..utils import Smarten, tex, add_spaces_around_brackets
+from MF_Tools.dual_compatibility import MANIM_TYPE, VGroup
+from ..utils import Smarten, tex, children_first, postorder, add_spaces_around_brackets, tex_glyph_count
+from ..rendering.tex_cache import compile_tex
+from .flat_tree import FlatTree
 from copy import deepcopy
+from contextlib import contextmanager
+from collections import deque
+from functools import wraps
+import weakref
+import threading
 
 
 algebra_config = {
@@ -9,15 +16,225 @@ algebra_config = {
 		"multiplication_mode": "juxtapose",
 		"division_mode": "fraction",
 		"decimal_precision": 4,
-		"always_color": {}
+		"always_color": {},
+		"tex_cache": False, # keep compiled Tex on disk across processes, see rendering.tex_cache
+		"tex_cache_dir": None, # defaults to ~/.cache/MF_Algebra/tex
+		"tex_cache_max_bytes": 256*2**20,
+		"tex_workers": 1, # processes to share batched compiles between, see rendering.tex_batch
+		"incremental_rendering": False, # experimental, see rendering.incremental
+		"persistent_trees": False, # edits share every untouched subexpression instead of copying, see Expression.replace_at_address
+		"number_mode": "float" # "exact" keeps compute in integers and fractions, see operations.divide
 	}
 
+# Number of glyphs on each side of \left( \right), measured once per size class.
+paren_length_cache = {}
+
+def measure_paren_length(size_class):
+	# Typesets one representative of the size class (see Expression.get_paren_size_class) in parentheses.
+	if size_class not in paren_length_cache:
+		string, content_glyphs = get_paren_measurement_string(size_class)
+		paren_length = get_paren_length(count_mob_glyphs(compile_tex(string)), content_glyphs)
+		assert paren_length is not None
+		paren_length_cache[size_class] = paren_length
+	return paren_length_cache[size_class]
+
+def get_paren_length(glyph_count, content_glyphs):
+	# Glyphs on each side from a measurement string's glyph count, or None if what's left over can't be a pair of parentheses
+	num_paren_glyphs = glyph_count - content_glyphs
+	if num_paren_glyphs <= 0 or num_paren_glyphs % 2:
+		return None
+	return num_paren_glyphs // 2
+
+def get_paren_measurement_string(size_class):
+	# Superscripts are stacked into a tower, which is then nested inside numerators, after any tall symbols.
+	# Returns the string along with the number of glyphs inside the parentheses.
+	fractions, exponents, tall_symbols = size_class
+	content = "1"
+	for _ in range(exponents):
+		content = "1^{" + content + "}"
+	for _ in range(fractions):
+		content = "{" + content + " \\over 1}"
+	content = "".join(symbol + " " for symbol, glyph_count in tall_symbols) + content
+	content_glyphs = 1 + exponents + 2 * fractions + sum(glyph_count for symbol, glyph_count in tall_symbols)
+	return add_spaces_around_brackets(r"\left(" + content + r"\right)"), content_glyphs
+
+def count_mob_glyphs(mob):
+	if MANIM_TYPE == 'GL':
+		return len(mob)
+	elif MANIM_TYPE == 'CE':
+		return len(mob[0])
+	else:
+		raise Exception(f"Unknown manim type: {MANIM_TYPE}")
+
+
+@contextmanager
+def number_mode_set_to(number_mode):
+	# Overrides algebra_config["number_mode"] inside, unless number_mode is None
+	previous_mode = algebra_config["number_mode"]
+	if number_mode is not None:
+		algebra_config["number_mode"] = number_mode
+	try:
+		yield
+	finally:
+		algebra_config["number_mode"] = previous_mode
+
+def memoized_compute(compute):
+	# For compute methods. The value, or the exception raised instead, is kept on the node for the current
+	# number mode until the node is invalidated. Descendants not yet computed are done first, deepest first
+	# off a stack, so each compute finds its children's values waiting and nothing recurses.
+	@wraps(compute)
+	def wrapper(expr, *args, **kwargs):
+		if args or kwargs:
+			return compute(expr, *args, **kwargs)
+		mode = algebra_config["number_mode"]
+		if expr._computed is None or expr._computed[0] != mode:
+			pending = []
+			stack = list(expr.children)
+			while stack:
+				subex = stack.pop()
+				if subex.children and (subex._computed is None or subex._computed[0] != mode):
+					pending.append(subex)
+					stack.extend(subex.children)
+			for subex in reversed(pending):
+				try:
+					subex.compute()
+				except Exception:
+					pass # kept on subex, and raised again if expr needs it
+			try:
+				expr._computed = (mode, True, compute(expr))
+			except Exception as error:
+				expr._computed = (mode, False, error)
+		_, succeeded, result = expr._computed
+		if succeeded:
+			return result
+		raise result.with_traceback(None) # or each raise would lengthen the one kept
+	return wrapper
+
+
+invalidation_state = threading.local() # invalidation_state.pending holds, inside batched_invalidation, the expressions whose parentheses have changed
+
+
+slot_names = {}
+def get_slot_names(cls):
+	# Every slot an instance of cls holds that is worth copying
+	if cls not in slot_names:
+		slot_names[cls] = [
+			name
+			for klass in reversed(cls.__mro__)
+			for name in getattr(klass, "__slots__", ())
+			if name not in ("_parents", "_hash", "_flat_tree", "_compiled", "_computed", "_free_variables", "_negative", "__weakref__")
+		]
+	return slot_names[cls]
+
+
 class Expression:
+	# Expressions get made by the million for problem sets and long timelines, so no node carries a __dict__.
+	# __weakref__ is there for the parent links.
+	__slots__ = (
+		"children", "parentheses", "_mob", "_glyph_index", "_hash", "_flat_tree", "_compiled", "_computed", "_free_variables",
+		"_negative", "_parents", "__weakref__"
+	)
+
 	def __init__(self, parentheses=False, **kwargs):
 		self.parentheses = parentheses
-		if algebra_config["auto_parentheses"]:
-			self.auto_parentheses()
 		self._mob = None
+		self._glyph_index = None
+		self._hash = None
+		self._flat_tree = None
+		self._compiled = None
+		self._computed = None
+		self._free_variables = None
+		self._negative = None
+		self._parents = [] # weak references to every expression which has self as a child
+		self.adopt_children()
+		if algebra_config["auto_parentheses"]:
+			if algebra_config["persistent_trees"]:
+				self.settle_child_parentheses()
+			else:
+				self.auto_parentheses()
+
+	def adopt_children(self):
+		for child in self.children:
+			child.add_parent(self)
+
+	def add_parent(self, parent):
+		# Usually there is just the one parent, but leaves like x are shared between many expressions.
+		# Dead references are only cleared out each time the list doubles, so adding stays cheap however many there are.
+		# A parent listed twice, as in x*y*x, costs nothing but a second visit from invalidate.
+		parents = self._parents
+		if parents and parents[-1]() is parent:
+			return
+		if len(parents) >= 8 and len(parents) & (len(parents) - 1) == 0:
+			parents[:] = [ref for ref in parents if ref() is not None]
+		parents.append(weakref.ref(parent))
+
+	def remove_parent(self, parent):
+		# Undoes add_parent. Looks from the end, where a parent which has only just adopted self will be.
+		parents = self._parents
+		for i in reversed(range(len(parents))):
+			if parents[i]() is parent:
+				del parents[i]
+				return
+
+	def invalidate(self):
+		# Marks self as needing its mob, glyph index, hash, flat tree, compiled functions, value, variables and sign found again,
+		# along with every expression containing it.
+		Expression.invalidate_all([self])
+
+	@staticmethod
+	def invalidate_all(subexes):
+		# Invalidates several expressions at once, visiting each expression containing them only once
+		stack, seen = list(subexes), set()
+		while stack:
+			subex = stack.pop()
+			if id(subex) in seen:
+				continue
+			seen.add(id(subex))
+			subex._mob = None
+			subex._glyph_index = None
+			subex._hash = None
+			subex._flat_tree = None
+			subex._compiled = None
+			subex._computed = None
+			subex._free_variables = None
+			subex._negative = None
+			stack.extend(parent for parent in (ref() for ref in subex._parents) if parent is not None)
+
+	@staticmethod
+	@contextmanager
+	def batched_invalidation():
+		# Parentheses changed inside are only invalidated on the way out, all together.
+		# The list of changed expressions is given out so reset_parentheses can drop any that changed back.
+		# Each thread batches on its own, so a prefetch thread can't pick up or flush another thread's changes.
+		outer = getattr(invalidation_state, "pending", None)
+		changed = invalidation_state.pending = []
+		try:
+			yield changed
+		finally:
+			invalidation_state.pending = outer
+			if outer is not None:
+				outer.extend(changed)
+			else:
+				Expression.invalidate_all(changed)
+
+	def __getstate__(self):
+		# Parent links are rebuilt by __setstate__ rather than copied, so copies point at their own parents.
+		# The hash is left out too since string hashes differ between processes.
+		state = {name: getattr(self, name) for name in get_slot_names(type(self)) if hasattr(self, name)}
+		state.update(getattr(self, "__dict__", {})) # subclasses outside the package may not declare slots
+		return state
+
+	def __setstate__(self, state):
+		for name, value in state.items():
+			setattr(self, name, value)
+		self._hash = None
+		self._flat_tree = None
+		self._compiled = None
+		self._computed = None
+		self._free_variables = None
+		self._negative = None
+		self._parents = []
+		self.adopt_children()
 
 	@property
 	def mob(self):
@@ -26,13 +243,55 @@ class Expression:
 		return self._mob
 
 	def init_mob(self, **kwargs):
-		string = add_spaces_around_brackets(str(self))
-		self._mob = Tex(string, **kwargs)
+		from ..rendering.incremental import can_assemble, assemble_mob
+		if algebra_config["incremental_rendering"] and not kwargs and can_assemble(self):
+			self.set_mob(assemble_mob(self))
+		else:
+			self.set_mob(compile_tex(self.get_tex_string(), **kwargs))
+
+	def set_mob(self, mob):
+		self._mob = mob
 		self.set_color_by_subex(algebra_config["always_color"])
+		return self
+
+	def get_tex_string(self):
+		return add_spaces_around_brackets(str(self))
 	
 	def copy(self):
+		# Copies the expression but not its mob, which is compiled again if the copy needs it
 		return deepcopy(self)
 
+	def copy_with_mob(self):
+		new = self.copy()
+		if self._mob is not None:
+			new._mob = self._mob.copy()
+		return new
+
+	def __deepcopy__(self, memo):
+		# Only the algebraic structure is copied, so deep copying anything holding expressions never copies point arrays
+		# Nodes are copied bottom-up off a stack, so deep expressions don't recurse.
+		for subex in postorder(self):
+			if id(subex) in memo:
+				continue
+			new = subex.copy_node([memo[id(child)] for child in subex.children])
+			memo[id(subex)] = new
+			if hasattr(subex, "__dict__"): # attributes of subclasses like Limit, some of which are also children
+				new.__dict__.update(deepcopy(subex.__dict__, memo))
+			new._glyph_index = subex._glyph_index
+			new._hash = subex._hash
+			new._computed = subex._computed
+			new._free_variables = subex._free_variables
+			new._negative = subex._negative
+		return memo[id(self)]
+
+	def copy_node(self, children=None):
+		# A new node like self, without a mob, with the very same children unless others are given
+		state = self.__getstate__()
+		state.update(children=list(self.children) if children is None else children, _mob=None, _glyph_index=None)
+		new = type(self).__new__(type(self))
+		new.__setstate__(state)
+		return new
+
 	def __getitem__(self, key):
 		if isinstance(key, str): # address of subexpressions, should return the glyphs corresponding to that subexpression
 			if MANIM_TYPE == 'GL':
@@ -44,111 +303,176 @@ class Expression:
 		else: # preserve behavior of Tex indexing
 			return self.mob.__getitem__(key)
 
+	@property
+	def flat_tree(self):
+		if self._flat_tree is None:
+			self._flat_tree = FlatTree(self)
+		return self._flat_tree
+
 	def get_all_addresses(self):
-		# Returns the addresses of all subexpressions
-		addresses = [""]
-		for n in range(len(self.children)):
-			for child_address in self.children[n].get_all_addresses():
-				addresses.append(str(n)+child_address)
-		return addresses
+		# Returns the addresses of all subexpressions, in order
+		return self.flat_tree.get_addresses()
 	
 	def get_all_nonleaf_addresses(self):
-		return sorted(list({a[:-1] for a in self.get_all_addresses() if a != ""}))
+		return self.flat_tree.get_nonleaf_addresses()
 	
 	def get_all_leaf_addresses(self):
-		return sorted(list(set(self.get_all_addresses()) - set(self.get_all_nonleaf_addresses())))
+		return self.flat_tree.get_leaf_addresses()
+
+	def walk(self, order="pre", where=None):
+		# Yields (address, subex) for each subexpression as it is reached, so a search can stop at the first one it wants
+		# without building any lists. order is "pre" (address order), "post" (children before parents) or "bfs"
+		# (shallowest first), and where, given a subexpression, says whether to yield it.
+		if order not in ("pre", "post", "bfs"):
+			raise ValueError(f"Invalid walk order: {order}. Order must be pre, post, or bfs")
+		def generate():
+			if order == "bfs":
+				queue = deque([("", self)])
+				while queue:
+					address, subex = queue.popleft()
+					if where is None or where(subex):
+						yield address, subex
+					queue.extend((address+str(n), child) for n, child in enumerate(subex.children))
+				return
+			# For postorder each subexpression goes back on the stack once, below its children, to be yielded after them
+			stack = [("", self, False)]
+			while stack:
+				address, subex, expanded = stack.pop()
+				if order == "post" and not expanded:
+					stack.append((address, subex, True))
+				elif where is None or where(subex):
+					yield address, subex
+				if not expanded:
+					stack.extend((address+str(n), subex.children[n], False) for n in reversed(range(len(subex.children))))
+		return generate()
 
 	def get_subex(self, address_string):
 		# Returns the Expression object corresponding to the subexpression at the given address.
 		# Note that this is not a submobject of self! It is a different mobject probably not on screen,
 		# it was just created to help create self.
-		if address_string == "":
-			return self
-		elif int(address_string[0]) < len(self.children):
-			return self.children[int(address_string[0])].get_subex(address_string[1:])
-		else:
-			raise IndexError(f"No subexpression of {self} at address {address_string} .")
+		subex = self
+		for n, digit in enumerate(address_string):
+			if int(digit) < len(subex.children):
+				subex = subex.children[int(digit)]
+			else:
+				raise IndexError(f"No subexpression of {subex} at address {address_string[n:]} .")
+		return subex
+
+	def get_node_key(self):
+		# What tells this node apart from others of its type, besides its children. Parentheses don't count.
+		return ()
+
+	def get_evaluation_key(self):
+		# What tells this node apart from others of its type when computing, see evaluation.get_dag
+		return self.get_node_key()
+
+	def __hash__(self):
+		# Structural, and cached until the expression is invalidated
+		# Unhashed children go on the stack ahead of their parent, so nothing recurses.
+		stack = [self] if self._hash is None else []
+		while stack:
+			subex = stack[-1]
+			unhashed = [child for child in subex.children if child._hash is None]
+			if unhashed:
+				stack.extend(unhashed)
+				continue
+			stack.pop()
+			subex._hash = hash((type(subex), subex.get_node_key(), *(child._hash for child in subex.children)))
+		return self._hash
+
+	def __eq__(self, other):
+		if not isinstance(other, Expression):
+			return NotImplemented
+		return self.is_identical_to(other)
 
 	def is_identical_to(self, other):
-		# Checks if they are equal as expressions. Implemented separately in leaves.
-		return type(self) == type(other) and len(self.children) == len(other.children) \
-			and all(self.children[i].is_identical_to(other.children[i]) for i in range(len(self.children)))
+		# Checks if they are equal as expressions. Comparing the cached hashes first rules out almost every mismatch at once.
+		stack = [(self, other)]
+		while stack:
+			a, b = stack.pop()
+			if a is b:
+				continue
+			if type(a) != type(b) or hash(a) != hash(b) \
+				or a.get_node_key() != b.get_node_key() or len(a.children) != len(b.children):
+				return False
+			stack.extend(zip(a.children, b.children))
+		return True
 
 	def get_addresses_of_subex(self, subex):
 		subex = Smarten(subex)
-		addresses = []
-		for ad in self.get_all_addresses():
-			if self.get_subex(ad).is_identical_to(subex):
-				addresses.append(ad)
-		return addresses
+		flat_tree = self.flat_tree
+		return [flat_tree.addresses[i] for i in flat_tree.find(subex)]
 
-	def get_glyphs_at_address(self, address):
-		from .operations import Negative
-		from .functions import Function
-		start = 0
-		for n,a in enumerate(address):
-			parent = self.get_subex(address[:n])
-			if parent.parentheses:
-				start += parent.paren_length()
-			if isinstance(parent, Combiner):
-				for i in range(int(a)):
-					sibling = parent.children[i]
-					start += len(sibling)
-					start += parent.symbol_glyph_length
-			elif isinstance(parent, Negative):
-				start += 1
-			elif isinstance(parent, Function):
-				start += parent.symbol_glyph_length
+	@property
+	def glyph_index(self):
+		if self._glyph_index is None:
+			self._glyph_index = self.build_glyph_index()
+		return self._glyph_index
+
+	def build_glyph_index(self):
+		# Maps every address to (start, end, paren_length, op_glyphs) for that subexpression's glyphs.
+		# Glyph counts are found bottom-up first, then positions are handed out top-down as prefix sums.
+		# Both passes run over the flat tree, the first backwards so that children are measured before their parents.
+		flat_tree = self.flat_tree
+		nodes, addresses = flat_tree.nodes, flat_tree.addresses
+		counts = [0] * len(nodes)
+		known = [False] * len(nodes)
+		for i in reversed(range(len(nodes))):
+			subex = nodes[i]
+			child_counts = [counts[c] for c in flat_tree.get_children(i)]
+			inner = subex.get_inner_glyph_count(child_counts)
+			if inner is None:
+				counts[i] = subex.get_rendered_glyph_count()
+			elif subex.parentheses:
+				counts[i] = inner + 2 * subex.paren_length()
 			else:
-				raise ValueError(f"Invalid parent type: {type(parent)}. n={n}, a={a}.")
-		end = start + len(self.get_subex(address))
+				counts[i] = inner
+			known[i] = inner is not None
+		index = {}
+		starts = [0] * len(nodes)
+		for i, subex in enumerate(nodes):
+			# A node is only reached if its parent is known, which has already set its start
+			if i > 0 and not known[flat_tree.parents[i]]:
+				continue
+			start = starts[i]
+			paren_length = subex.paren_length() if subex.parentheses else 0
+			inner_start = start + paren_length
+			if not known[i]:
+				index[addresses[i]] = (start, start + counts[i], paren_length, [])
+				continue
+			children = flat_tree.get_children(i)
+			child_offsets, op_offsets = subex.get_glyph_layout([counts[c] for c in children])
+			index[addresses[i]] = (start, start + counts[i], paren_length, [inner_start + o for o in op_offsets])
+			for c, offset in zip(children, child_offsets):
+				starts[c] = inner_start + offset
+		return index
+
+	def get_glyph_index_entry(self, address):
+		try:
+			return self.glyph_index[address]
+		except KeyError:
+			parent = self.get_subex(address[:-1]) # raises IndexError if there is no such address
+			raise ValueError(f"Invalid parent type: {type(parent)}. address={address}.")
+
+	def get_glyphs_at_address(self, address):
+		start, end, paren_length, op_glyphs = self.get_glyph_index_entry(address)
 		return list(range(start, end))
 
 	def get_left_paren_glyphs(self, address):
-		subex = self.get_subex(address)
-		if not subex.parentheses:
-			return []
-		subex_glyphs = self.get_glyphs_at_address(address)
-		start = subex_glyphs[0]
-		end = start + subex.paren_length()
-		return list(range(start, end))
+		start, end, paren_length, op_glyphs = self.get_glyph_index_entry(address)
+		return list(range(start, start + paren_length))
 
 	def get_right_paren_glyphs(self, address):
-		subex = self.get_subex(address)
-		if not subex.parentheses:
-			return []
-		subex_glyphs = self.get_glyphs_at_address(address)
-		end = subex_glyphs[-1]
-		start = end - subex.paren_length()
-		return list(range(start+1, end+1))
+		start, end, paren_length, op_glyphs = self.get_glyph_index_entry(address)
+		return list(range(end - paren_length, end))
 	
 	def get_exp_glyphs_without_parentheses(self, address):
-		subex = self.get_subex(address)
-		subex_glyphs = self.get_glyphs_at_address(address)
-		if not subex.parentheses:
-			return subex_glyphs
-		else:
-			paren_length = subex.paren_length()
-			return subex_glyphs[paren_length:-paren_length]
+		start, end, paren_length, op_glyphs = self.get_glyph_index_entry(address)
+		return list(range(start + paren_length, end - paren_length))
 	
 	def get_op_glyphs(self, address):
-		from .functions import Function
-		subex = self.get_subex(address)
-		if not isinstance(subex, (Combiner, Function)) or subex.symbol_glyph_length==0:
-			return []
-		subex_glyphs = self.get_glyphs_at_address(address)
-		results = []
-		turtle = subex_glyphs[0]
-		if subex.parentheses:
-			turtle += subex.paren_length()
-		if isinstance(subex, Function):
-			results += list(range(turtle, turtle + subex.symbol_glyph_length))
-		elif isinstance(subex, Combiner):
-			for child in subex.children[:-1]:
-				turtle += len(child)
-				results += list(range(turtle, turtle + subex.symbol_glyph_length))
-				turtle += subex.symbol_glyph_length
-		return results
+		start, end, paren_length, op_glyphs = self.get_glyph_index_entry(address)
+		return list(op_glyphs)
 	
 	def get_glyphs(self, psuedoaddress):
 		# Returns the list of glyph indices corresponding to the subexpression at the given address.
@@ -172,12 +496,27 @@ class Expression:
 			return sorted(set(results))
 
 	def __len__(self):
-		if MANIM_TYPE == 'GL':
-			return len(self.mob)
-		elif MANIM_TYPE == 'CE':
-			return len(self.mob[0])
-		else:
-			raise Exception(f"Unknown manim type: {MANIM_TYPE}")
+		return self.glyph_count()
+
+	def glyph_count(self):
+		# Returns the number of glyphs in self.mob, worked out from the tree so that nothing gets compiled.
+		# Only falls back to rendering when get_inner_glyph_count doesn't know how to count something.
+		start, end, paren_length, op_glyphs = self.glyph_index[""]
+		return end
+
+	def get_inner_glyph_count(self, child_glyph_counts):
+		# Number of glyphs excluding own parentheses, or None if unknown. Implemented in subclasses.
+		return None
+
+	def get_glyph_layout(self, child_glyph_counts):
+		# Returns where each child and each operator glyph starts, relative to the start of self
+		# without its parentheses. Implemented in subclasses which have children.
+		if len(self.children) > 0:
+			raise ValueError(f"Invalid parent type: {type(self)}.")
+		return [], []
+
+	def get_rendered_glyph_count(self):
+		return count_mob_glyphs(self.mob)
 
 	def __neg__(self):
 		from .operations import Negative
@@ -256,34 +595,107 @@ class Expression:
 		return False # catchall if not defined in subclasses
 
 	def give_parentheses(self, parentheses=True):
-		self.parentheses = parentheses
-		self._mob = None # Don't init mob just yet, just mark it as needing to be reinitialized
+		if parentheses != self.parentheses:
+			self.parentheses = parentheses
+			pending = getattr(invalidation_state, "pending", None)
+			if pending is not None:
+				pending.append(self)
+			else:
+				self.invalidate() # Don't init mob just yet, just mark it as needing to be reinitialized
 		return self
 
 	def clear_all_parentheses(self):
-		for c in self.children:
-			c.clear_all_parentheses()
-		self.give_parentheses(False)
+		stack = [self]
+		while stack:
+			subex = stack.pop()
+			subex.give_parentheses(False)
+			stack.extend(subex.children)
 		return self
 
+	def get_child_parentheses(self):
+		# Which of self's children need parentheses, judging only by self and the child itself
+		return [False] * len(self.children)
+
 	def auto_parentheses(self):
-		for child in self.children:
-			child.auto_parentheses()
+		stack = [self]
+		with Expression.batched_invalidation():
+			while stack:
+				stack.extend(stack.pop().give_child_parentheses())
+		return self
+
+	def give_child_parentheses(self):
+		# One step of auto_parentheses, returning the children it should continue into
+		for child, parentheses in zip(self.children, self.get_child_parentheses()):
+			if parentheses:
+				child.give_parentheses()
+		return self.children
+
+	def settle_child_parentheses(self, exact=False):
+		# auto_parentheses for persistent trees, which only looks one level down. A child whose parentheses
+		# have to change is swapped for a copy, since it may be shared with other expressions.
+		# Parentheses are only given unless exact, in which case they are also taken away like reset_parentheses would.
+		changed = False
+		for n, parentheses in enumerate(self.get_child_parentheses()):
+			child = self.children[n]
+			if not exact:
+				parentheses = parentheses or child.parentheses
+			if child.parentheses != parentheses:
+				new_child = child.copy_node()
+				new_child.parentheses = parentheses
+				self.children[n] = new_child
+				new_child.add_parent(self)
+				if not any(other is child for other in self.children):
+					child.remove_parent(self)
+				changed = True
+		if changed:
+			self.invalidate()
 		return self
 	
+	def reset_new_parentheses(self, old):
+		# reset_parentheses for persistent trees. Subexpressions of old are left untouched, since they are shared
+		# with old, and were already reset when old was made. Returns self or a copy of it.
+		old_ids = set()
+		stack = [old]
+		while stack:
+			subex = stack.pop()
+			old_ids.add(id(subex))
+			stack.extend(subex.children)
+		result = self.copy_node() if id(self) in old_ids else self
+		result.parentheses = False
+		stack = [result]
+		while stack:
+			subex = stack.pop()
+			subex.settle_child_parentheses(exact=True)
+			stack.extend(child for child in subex.children if id(child) not in old_ids)
+		return result
+
 	def reset_parentheses(self):
-		self.clear_all_parentheses()
-		self.auto_parentheses()
+		# Only the subexpressions whose parentheses end up different are invalidated
+		subexes = list(self.flat_tree.nodes)
+		before = [subex.parentheses for subex in subexes]
+		with Expression.batched_invalidation() as changed:
+			self.clear_all_parentheses()
+			self.auto_parentheses()
+			changed[:] = [subex for subex, parentheses in zip(subexes, before) if subex.parentheses != parentheses]
 		return self
 
 	def paren_length(self):
 		# Returns the number of glyphs taken up by the expression's potential parentheses.
 		# Usually 1 but can be larger for larger parentheses.
-		yes_paren = self.copy().give_parentheses(True)
-		no_paren = self.copy().give_parentheses(False)
-		num_paren_glyphs = len(yes_paren) - len(no_paren)
-		assert num_paren_glyphs > 0 and num_paren_glyphs % 2 == 0
-		return num_paren_glyphs // 2
+		return measure_paren_length(self.get_paren_size_class())
+
+	@children_first
+	def get_paren_size_class(self):
+		# How tall \left( \right) has to stretch around self, as (stacked fractions, stacked exponents, tall symbols),
+		# the last being (symbol, glyph count) of big operators like \int, sorted, see Function.tall_symbol.
+		# Overridden by Div, Pow and Function, everything else is as tall as its tallest child.
+		fractions, exponents, tall_symbols = 0, 0, set()
+		for child in self.children:
+			child_fractions, child_exponents, child_tall_symbols = child.get_paren_size_class()
+			fractions = max(fractions, child_fractions)
+			exponents = max(exponents, child_exponents)
+			tall_symbols.update(child_tall_symbols)
+		return fractions, exponents, tuple(sorted(tall_symbols))
 
 	#Man these guys do not work correctly yet
 	def nest(self, direction="right", recurse=True):
@@ -313,36 +725,90 @@ class Expression:
 				new_children.append(child)
 		return type(self)(*new_children)
 
-	def substitute_at_address(self, subex, address):
-		from .functions import Function
-		from .operations import Negative
-		subex = Smarten(subex).copy() #?
-		if len(address) == 0:
-			return subex
-		new_child = self.children[int(address[0])].substitute_at_address(subex, address[1:])
-		new_children = self.children[:int(address[0])] + [new_child] + self.children[int(address[0])+1:]
-		if isinstance(self, (Combiner, Negative)):
-			return type(self)(*new_children)
-		elif isinstance(self, Function):
-			return Function(self.symbol, self.symbol_glyph_length, self.rule, self.algebra_rule, self.parentheses_mode)(*new_children)
-		else:
-			raise ValueError("Something went wrong here... and this whole method needs a rewrite / rethink lol")
+	def replace_at_addresses(self, replacements, reset_parentheses=False):
+		# Persistent substitution: replacements maps addresses to the subexpressions which go there, as they are, not copies.
+		# Only the nodes on the way down to those addresses are new, every other subexpression is shared with self.
+		# Where one address is inside another, the outer one wins.
+		# With reset_parentheses the new nodes' children end up as reset_parentheses would leave them.
+		# The nodes on the way are found going down, each listed after its parent, then copied in reverse with their new children.
+		# Addresses are read a digit at a time at each node's depth rather than sliced.
+		visits = [(self, replacements, 0, -1, None)]
+		for i, (subex, replacements_here, depth, _, _) in enumerate(visits):
+			if any(len(address) == depth for address in replacements_here):
+				continue
+			child_replacements = {}
+			for address, replacement in replacements_here.items():
+				child_replacements.setdefault(int(address[depth]), {})[address] = replacement
+			visits.extend((subex.children[n], replacements_in_child, depth+1, i, n) for n, replacements_in_child in child_replacements.items())
+		new_children = [[] for _ in visits]
+		for i in reversed(range(len(visits))):
+			subex, replacements_here, depth, parent, n = visits[i]
+			ends_here = [replacement for address, replacement in replacements_here.items() if len(address) == depth]
+			if ends_here:
+				result = ends_here[0]
+			else:
+				# Made from its final children, so the ones it replaces never get linked to it
+				children = list(subex.children)
+				for child_n, child in new_children[i]:
+					children[child_n] = child
+				result = subex.copy_node(children)
+				if algebra_config["auto_parentheses"]:
+					result.settle_child_parentheses(exact=reset_parentheses)
+			if parent >= 0:
+				new_children[parent].append((n, result))
+		return result
+
+	def replace_at_indices(self, replacements):
+		# Like replace_at_addresses, but replacements maps indices into self.flat_tree, none inside another.
+		# Going over the flat tree backwards copies each changed node after its children, in time linear in the size of self.
+		flat_tree = self.flat_tree
+		results = {}
+		for i in reversed(range(len(flat_tree))):
+			if i in replacements:
+				results[i] = replacements[i]
+				continue
+			new_children = [(n, results[c]) for n, c in enumerate(flat_tree.get_children(i)) if c in results]
+			if new_children:
+				children = list(flat_tree.nodes[i].children)
+				for n, child in new_children:
+					children[n] = child
+				result = flat_tree.nodes[i].copy_node(children)
+				if algebra_config["auto_parentheses"]:
+					result.settle_child_parentheses()
+				results[i] = result
+		return results.get(0, self)
+
+	def replace_at_address(self, subex, address, reset_parentheses=False):
+		return self.replace_at_addresses({address: subex}, reset_parentheses)
 
 	def substitute_at_addresses(self, subex, addresses):
-		result = self.copy()
-		for address in addresses:
-			result = result.substitute_at_address(subex, address)
-		return result
+		subex = Smarten(subex)
+		if algebra_config["persistent_trees"]:
+			return self.replace_at_addresses({address: subex for address in addresses})
+		# Otherwise the result shares nothing with self
+		return self.copy().replace_at_addresses({address: subex.copy() for address in addresses})
+
+	def substitute_at_address(self, subex, address):
+		return self.substitute_at_addresses(subex, [address])
 
 	def substitute(self, expression_dict):
-		result = self.copy()
-		dict_with_numbers = list(enumerate(expression_dict.items()))
-		from .variables import Variable
-		for i, (from_subex, to_subex) in dict_with_numbers:
-			result = result.substitute_at_addresses(Variable(f"T_{i}"), result.get_addresses_of_subex(from_subex))
-		for i, (from_subex, to_subex) in dict_with_numbers:
-			result = result.substitute_at_addresses(to_subex, result.get_addresses_of_subex(Variable(f"T_{i}")))
-		return result
+		# Every key is swapped for its value at once, so {x:y, y:x} swaps x and y, and values are never substituted into.
+		# Where occurrences overlap the outermost one is replaced.
+		flat_tree = self.flat_tree
+		values = {}
+		for from_subex, to_subex in expression_dict.items():
+			for index in flat_tree.find(Smarten(from_subex)):
+				values[index] = Smarten(to_subex)
+		replacements = {}
+		end = 0
+		for index in sorted(values):
+			if index >= end:
+				replacements[index] = values[index]
+				end = flat_tree.ends[index]
+		if algebra_config["persistent_trees"]:
+			return self.replace_at_indices(replacements)
+		# A copy has the same shape, so the indices carry over to its flat tree
+		return self.copy().replace_at_indices({index: subex.copy() for index, subex in replacements.items()})
 
 	def set_color_by_subex(self, subex_color_dict):
 		for subex, color in subex_color_dict.items():
@@ -352,14 +818,84 @@ class Expression:
 					self[ad+"()"].set_color(self.color)
 		return self
 
-	def evaluate(self):
-		return Smarten(self.compute())
+	def evaluate(self, number_mode=None):
+		# number_mode overrides algebra_config["number_mode"] for just this evaluation
+		with number_mode_set_to(number_mode):
+			return Smarten(self.compute())
+
+	@property
+	def free_variables(self):
+		# Every variable in self, found bottom-up like the hash and kept until self is invalidated
+		stack = [self] if self._free_variables is None else []
+		while stack:
+			subex = stack[-1]
+			unknown = [child for child in subex.children if child._free_variables is None]
+			if unknown:
+				stack.extend(unknown)
+				continue
+			stack.pop()
+			subex._free_variables = subex.get_own_variables().union(*(child._free_variables for child in subex.children))
+		return self._free_variables
+
+	def get_own_variables(self):
+		return frozenset()
+
+	@property
+	def is_constant(self):
+		return not self.free_variables
+
+	def fold_constants(self, number_mode=None):
+		# Replaces each largest subexpression without variables that computes by its value
+		flat_tree = self.flat_tree
+		replacements = {}
+		i = 0
+		with number_mode_set_to(number_mode):
+			while i < len(flat_tree):
+				subex = flat_tree.nodes[i]
+				if subex.children and subex.is_constant:
+					try:
+						replacements[i] = Smarten(subex.compute())
+						i = flat_tree.ends[i]
+						continue
+					except (ValueError, TypeError, ArithmeticError, NotImplementedError):
+						pass
+				i += 1
+		if algebra_config["persistent_trees"]:
+			return self.replace_at_indices(replacements)
+		return self.copy().replace_at_indices(replacements)
+
+	def compute_vectorized(self, *child_values):
+		# What self comes to given the values of its children, each a number or a whole array of them.
+		# Used by vectorize, which handles variables itself.
+		raise ValueError(f"{type(self).__name__} cannot be vectorized.")
+
+	def vectorize(self, *variables):
+		from .evaluation import vectorize
+		return vectorize(self, *variables)
+
+	def get_code(self, child_codes, constant):
+		# Python source for what self computes to, given the source for each child's value.
+		# constant(value) gives a name standing for any other value the source needs. Used by compile.
+		raise ValueError(f"{type(self).__name__} cannot be compiled.")
+
+	def compile(self, variables=None):
+		# A Python function of the variables' values which gives the same as compute, made once per list of variables
+		# and kept until self is invalidated. Without variables, they are taken in the order they first appear.
+		from .evaluation import compile_expression
+		key = None if variables is None else tuple(Smarten(variable) for variable in variables)
+		if self._compiled is None:
+			self._compiled = {}
+		if key not in self._compiled:
+			self._compiled[key] = compile_expression(self, variables)
+		return self._compiled[key]
 
 	def __repr__(self):
 		return type(self).__name__ + "(" + str(self) + ")"
 
 
 class Combiner(Expression):
+	__slots__ = ("symbol", "symbol_glyph_length", "left_spacing", "right_spacing")
+
 	def __init__(self, symbol, symbol_glyph_length, *children, **kwargs):
 		self.symbol = symbol
 		self.symbol_glyph_length = symbol_glyph_length
@@ -374,7 +910,22 @@ class Combiner(Expression):
 		result = joiner.join(["{" + str(child) + "}" for child in self.children])
 		return result
 	
+	def get_inner_glyph_count(self, child_glyph_counts):
+		return sum(child_glyph_counts) + self.symbol_glyph_length * max(len(self.children) - 1, 0)
+
+	def get_glyph_layout(self, child_glyph_counts):
+		child_offsets, op_offsets = [], []
+		turtle = 0
+		for n, count in enumerate(child_glyph_counts):
+			if n > 0:
+				op_offsets += range(turtle, turtle + self.symbol_glyph_length)
+				turtle += self.symbol_glyph_length
+			child_offsets.append(turtle)
+			turtle += count
+		return child_offsets, op_offsets
+
 	def set_spacing(self, left_spacing, right_spacing):
 		self.left_spacing = left_spacing
 		self.right_spacing = right_spacing
+		self.invalidate()
 
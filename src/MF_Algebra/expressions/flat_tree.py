@@ -0,0 +1,93 @@
+import numpy as np
+
+
+node_type_codes = {} # every expression type seen so far, numbered in order of appearance
+
+def get_node_type_code(node_type):
+	return node_type_codes.setdefault(node_type, len(node_type_codes))
+
+
+class FlatTree:
+	"""
+		The subexpressions of an expression in preorder, which is also address order,
+		along with parallel arrays describing the shape of the tree:
+			parents       index of each node's parent, -1 for the root
+			depths        length of each node's address
+			child_counts  number of children of each node
+			ends          index just past each node's subtree, so node i's descendants are i+1 up to ends[i]
+			type_codes    get_node_type_code of each node's type
+		Get one from Expression.flat_tree, which keeps it until the expression is invalidated.
+	"""
+	def __init__(self, expr):
+		nodes, addresses, parents = [], [], []
+		stack = [(expr, "", -1)]
+		while stack:
+			node, address, parent = stack.pop()
+			index = len(nodes)
+			nodes.append(node)
+			addresses.append(address)
+			parents.append(parent)
+			stack.extend((node.children[n], address + str(n), index) for n in reversed(range(len(node.children))))
+		self.nodes = nodes
+		self.addresses = addresses
+		self.parents = np.array(parents, dtype=np.intp)
+		self.depths = np.array([len(address) for address in addresses], dtype=np.intp)
+		self.child_counts = np.array([len(node.children) for node in nodes], dtype=np.intp)
+		self.type_codes = np.array([get_node_type_code(type(node)) for node in nodes], dtype=np.intp)
+		# Subtree sizes, each added into its parent's from the last node back, which stays linear however deep the tree
+		sizes = [1] * len(nodes)
+		for i in range(len(nodes) - 1, 0, -1):
+			sizes[parents[i]] += sizes[i]
+		self.ends = np.arange(len(nodes)) + np.array(sizes, dtype=np.intp)
+		self.indices = None
+		self.subtree_index = None
+
+	def __len__(self):
+		return len(self.nodes)
+
+	@property
+	def is_leaf(self):
+		return self.child_counts == 0
+
+	def get_addresses(self, mask=None):
+		if mask is None:
+			return list(self.addresses)
+		return [self.addresses[i] for i in np.flatnonzero(mask)]
+
+	def get_leaf_addresses(self):
+		return self.get_addresses(self.is_leaf)
+
+	def get_nonleaf_addresses(self):
+		return self.get_addresses(~self.is_leaf)
+
+	def get_index(self, address):
+		if self.indices is None:
+			self.indices = {address: i for i, address in enumerate(self.addresses)}
+		return self.indices[address]
+
+	def get_subtree_index(self):
+		# Maps the structural hash of every subexpression to the indices of the nodes with that hash, in address order
+		if self.subtree_index is None:
+			# Hashing from the last node back means every child is hashed before its parent
+			hashes = [hash(node) for node in reversed(self.nodes)][::-1]
+			self.subtree_index = {}
+			for i, node_hash in enumerate(hashes):
+				self.subtree_index.setdefault(node_hash, []).append(i)
+		return self.subtree_index
+
+	def find(self, subex):
+		# Indices of every node identical to subex
+		return [i for i in self.get_subtree_index().get(hash(subex), []) if self.nodes[i].is_identical_to(subex)]
+
+	def get_children(self, index):
+		# Each child's subtree ends where the next child begins
+		children = []
+		child = index + 1
+		for _ in range(self.child_counts[index]):
+			children.append(child)
+			child = int(self.ends[child])
+		return children
+
+	def get_levels(self):
+		# Node indices at each depth, in address order
+		return [np.flatnonzero(self.depths == depth) for depth in range(self.depths.max() + 1)]
@@ -1,8 +1,12 @@
 from .expression_core import *
 from .sequences import Sequence
+import numpy as np
 
 
 class Function(Expression):
+	__slots__ = ("symbol", "symbol_glyph_length", "rule", "algebra_rule", "parentheses_mode", "spacing")
+	tall_symbol = False # True for big operators like \int, which stretch parentheses around them like a fraction would
+
 	def __init__(self, symbol, symbol_glyph_length, rule=None, algebra_rule=None, parentheses_mode="always", **kwargs):
 		self.symbol = symbol #string
 		self.symbol_glyph_length = symbol_glyph_length #int
@@ -20,47 +24,91 @@ class Function(Expression):
 	def __call__(self, *inputs, **kwargs):
 		assert len(self.children[0].children) == 0, f"Function {self.symbol} cannot be called because it already has children."
 		new_func = self.copy()
-		new_func.children[0].children = list(map(Smarten, inputs))
+		new_func.children[0] = Sequence(*inputs)
 		# have to reinitialize Expression and MathTex after setting children for correct indexing and auto_paren.
-		Expression.__init__(self, parentheses = self.parentheses)
+		Expression.__init__(new_func, parentheses = new_func.parentheses)
 		return new_func
 	
 	@property
 	def arguments(self):
 		return self.children[0].children
 	
+	def get_node_key(self):
+		return (self.symbol,)
+
+	def get_evaluation_key(self):
+		# Functions written the same can still have different rules
+		return (self.symbol, id(self.rule))
+
+	@children_first
+	def get_paren_size_class(self):
+		fractions, exponents, tall_symbols = super().get_paren_size_class()
+		if self.tall_symbol:
+			tall_symbols = tuple(sorted({*tall_symbols, (self.symbol, self.symbol_glyph_length)}))
+		return fractions, exponents, tall_symbols
+
+	def get_inner_glyph_count(self, child_glyph_counts):
+		# Only the arguments are typeset after the symbol, further children are drawn within it
+		if len(self.children) == 0:
+			return self.symbol_glyph_length
+		return self.symbol_glyph_length + child_glyph_counts[0]
+
+	def get_glyph_layout(self, child_glyph_counts):
+		return [self.symbol_glyph_length] * len(self.children), list(range(self.symbol_glyph_length))
+
 	def set_spacing(self, spacing):
 		self.spacing = spacing
+		self.invalidate()
 		return self
 	
-	def auto_parentheses(self):
+	def get_child_parentheses(self):
+		# Only the arguments ever get parentheses
+		child_parentheses = [False] * len(self.children)
 		if len(self.children) == 0:
-			return
+			return child_parentheses
 		child = self.children[0] #sequence
 		if len(child.children) == 0:
-			return
+			return child_parentheses
 		if self.parentheses_mode == "always":
-			child.give_parentheses(True)
+			child_parentheses[0] = True
 		elif self.parentheses_mode in ["weak", "strong"]:
 			from ..expressions.operations import Operation, Add, Sub
 			if len(child.children) > 1:
-				child.give_parentheses(True)
+				child_parentheses[0] = True
 			elif isinstance(child.children[0], (Add, Sub)):
-				child.give_parentheses(True)
+				child_parentheses[0] = True
 			else:
 				if self.parentheses_mode == "strong":
 					if isinstance(child.children[0], Operation):
-						child.give_parentheses(True)
-		elif self.parentheses_mode == "never":
-			child.give_parentheses(False)
-		else:
+						child_parentheses[0] = True
+		elif self.parentheses_mode != "never":
 			raise ValueError(f"Unsupported parentheses mode {self.parentheses_mode}.")
+		return child_parentheses
+
+	def give_child_parentheses(self):
+		# Unlike the other expressions, arguments are left as they are rather than recursed into
+		if self.children and self.get_child_parentheses()[0]:
+			self.children[0].give_parentheses(True)
+		elif self.parentheses_mode == "never" and self.children:
+			self.children[0].give_parentheses(False)
+		return []
 		
+	@memoized_compute
 	def compute(self, *args):
 		if len(args) == 0:
 			return self.rule(*map(lambda exp: exp.compute(), self.children[0].children))
 		else:
 			return self.rule(*args)
+
+	def compute_vectorized(self, arguments, *parameters):
+		# Rules like np.sin take whole arrays, others are applied one element at a time
+		try:
+			return self.rule(*arguments)
+		except TypeError:
+			return np.vectorize(self.rule)(*arguments)
+
+	def get_code(self, child_codes, constant):
+		return f"{constant(self.rule)}(*{child_codes[0]})"
 	
     #def __pow__(self, other):
     # Gotta do something about sin^2 etc   
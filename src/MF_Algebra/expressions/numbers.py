@@ -1,9 +1,12 @@
 from .expression_core import *
 from .operations import Div
 import numpy as np
+from inspect import unwrap
 
 
 class Number(Expression):
+	__slots__ = ()
+
 	def __init__(self, **kwargs):
 		self.children = []
 		super().__init__(**kwargs)
@@ -11,8 +14,20 @@ class Number(Expression):
 	def compute(self):
 		return float(self)
 
+	def compute_vectorized(self):
+		return self.compute()
+
+	def get_code(self, child_codes, constant):
+		return constant(self.compute())
+
+	def get_inner_glyph_count(self, child_glyph_counts):
+		# Unwrapped, __str__ gives the string before @tex adds any parentheses
+		return tex_glyph_count(unwrap(type(self).__str__)(self))
+
 
 class Integer(Number):
+	__slots__ = ("n",)
+
 	def __init__(self, n, **kwargs):
 		self.n = n
 		super().__init__(**kwargs)
@@ -27,8 +42,8 @@ class Integer(Number):
 	def compute(self):
 		return self.n
 
-	def is_identical_to(self, other):
-		return type(self) == type(other) and self.n == other.n
+	def get_node_key(self):
+		return (self.n,)
 
 	def is_negative(self):
 		return self.n < 0
@@ -50,6 +65,8 @@ class Integer(Number):
 
 
 class Real(Number):
+	__slots__ = ("x", "symbol")
+
 	def __init__(self, x, symbol=None, **kwargs):
 		self.x = x
 		self.symbol = symbol
@@ -68,8 +85,8 @@ class Real(Number):
 	def __float__(self):
 		return float(self.x)
 
-	def is_identical_to(self, other):
-		return type(self) == type(other) and self.x == other.x
+	def get_node_key(self):
+		return (self.x,)
 
 	def is_negative(self):
 		return self.x < 0
@@ -78,6 +95,8 @@ class Real(Number):
 class Rational(Div):
 	# Better to subclass Div than Number because 5/3 is no more a number than 5^3 or 5+3
 	# Multiclassing is an option but seems to be more trouble than it's worth
+	__slots__ = ()
+
 	def __init__(self, a, b, **kwargs):
 		if not isinstance(a, (Integer, int)):
 			raise TypeError (f"Unsupported numerator type {type(a)}: {a}")
@@ -1,47 +1,103 @@
 from .expression_core import *
+import operator
+from functools import reduce
+from fractions import Fraction
+
+
+def divide(num, den):
+	# Division as Div computes it, an int whenever it comes out even.
+	# In exact number mode integers and fractions give a Fraction otherwise, in lowest terms.
+	if den == 0:
+		raise ZeroDivisionError
+	if algebra_config["number_mode"] == "exact" and isinstance(num, (int, Fraction)) and isinstance(den, (int, Fraction)):
+		if isinstance(num, int) and isinstance(den, int) and num % den == 0:
+			return num // den
+		return Fraction(num, den)
+	if num % den == 0:
+		return int(num / den)
+	else:
+		return float(num) / float(den)
+
+
+def power(base, exponent):
+	# In exact number mode a negative integer power of an integer or fraction is a Fraction rather than a float
+	if algebra_config["number_mode"] == "exact" and isinstance(exponent, int) and exponent < 0 and isinstance(base, (int, Fraction)):
+		return Fraction(base) ** exponent
+	return base ** exponent
+
+
+def leading_sign(expr):
+	# Sums, differences and products are negative when their first term is. The leftmost path is walked with a loop
+	# down to the first node that already knows, and every node on the way keeps the answer, so left-deep chains stay linear.
+	path = []
+	while isinstance(expr, (Add, Sub, Mul)) and expr._negative is None:
+		path.append(expr)
+		expr = expr.children[0]
+	negative = expr._negative if isinstance(expr, (Add, Sub, Mul)) else expr.is_negative()
+	for node in path:
+		node._negative = negative
+	return negative
 
 
 class Operation(Combiner):
+	__slots__ = ()
+	code_symbol = None # the Python operator for eval_op, if there is one
+
 	def __init__(self, symbol, symbol_glyph_length, *children, **kwargs):
 		super().__init__(symbol, symbol_glyph_length, *children, **kwargs)
 
+	@memoized_compute
 	def compute(self):
 		result = self.children[0].compute()
 		for child in self.children[1:]:
 			result = self.eval_op(result, child.compute())
 		return result
 
+	def compute_vectorized(self, *child_values):
+		return reduce(self.eval_op, child_values)
+
+	def get_code(self, child_codes, constant):
+		# Folded from the left like compute, in parentheses since ** would otherwise group from the right
+		code = child_codes[0]
+		for child_code in child_codes[1:]:
+			if self.code_symbol is None:
+				code = f"{constant(self.eval_op)}({code}, {child_code})"
+			else:
+				code = f"({code} {self.code_symbol} {child_code})"
+		return code
+
 
 class Add(Operation):
+	__slots__ = ()
+	eval_op = staticmethod(operator.add)
+	code_symbol = "+"
+
 	def __init__(self, *children, **kwargs):
-		self.eval_op = lambda x,y: x+y
 		super().__init__("+", 1, *children, **kwargs)
 
-	def auto_parentheses(self):
-		for child in self.children:
-			child.auto_parentheses()
-
 	def is_negative(self):
-		return self.children[0].is_negative()
+		return leading_sign(self)
 
 class Sub(Operation):
+	__slots__ = ()
+	eval_op = staticmethod(operator.sub)
+	code_symbol = "-"
+
 	def __init__(self, *children, **kwargs):
-		self.eval_op = lambda x,y: x-y
 		super().__init__("-", 1,*children, **kwargs)
 
-	def auto_parentheses(self):
-		self.children[0].auto_parentheses()
-		for child in self.children[1:]:
-			if isinstance(child, (Add, Sub)) or child.is_negative():
-				child.give_parentheses()
-			child.auto_parentheses()
+	def get_child_parentheses(self):
+		return [False] + [isinstance(child, (Add, Sub)) or child.is_negative() for child in self.children[1:]]
 
 	def is_negative(self):
-		return self.children[0].is_negative()
+		return leading_sign(self)
 
 class Mul(Operation):
+	__slots__ = ("mode",)
+	eval_op = staticmethod(operator.mul)
+	code_symbol = "*"
+
 	def __init__(self, *children, mode=None, **kwargs):
-		self.eval_op = lambda x,y: x*y
 		self.mode = algebra_config["multiplication_mode"] if mode is None else mode
 		if self.mode == "dot":
 			super().__init__("\\cdot", 1, *children, **kwargs)
@@ -52,18 +108,17 @@ class Mul(Operation):
 		else:
 			raise ValueError(f"Invalid multiplication mode: {self.mode}. Mode must be dot, x, or juxtapose")
 
-	def auto_parentheses(self): # should be more intelligent based on mode
-		for child in self.children:
-			if isinstance(child, (Add, Sub)) or child.is_negative():
-				child.give_parentheses()
-			child.auto_parentheses()
+	def get_child_parentheses(self): # should be more intelligent based on mode
+		return [isinstance(child, (Add, Sub)) or child.is_negative() for child in self.children]
 
 	def is_negative(self):
-		return self.children[0].is_negative()
+		return leading_sign(self)
 
 class Div(Operation):
+	__slots__ = ("mode",)
+	eval_op = staticmethod(operator.truediv)
+
 	def __init__(self, *children, mode=None, **kwargs):
-		self.eval_op = lambda x,y: x/y
 		self.mode = algebra_config["division_mode"] if mode is None else mode
 		if self.mode == "fraction":
 			super().__init__("\\over", 1, *children, **kwargs)
@@ -72,42 +127,54 @@ class Div(Operation):
 		else:
 			raise ValueError(f"Invalid division mode: {self.mode}. Mode must be fraction or inline")
 
-	def auto_parentheses(self):
-		for child in self.children:
-			if (isinstance(child, (Add, Sub, Mul, Div)) or child.is_negative()) and algebra_config["division_mode"] == "inline":
-				child.give_parentheses()
-			child.auto_parentheses()
+	def get_child_parentheses(self):
+		return [
+			(isinstance(child, (Add, Sub, Mul, Div)) or child.is_negative()) and algebra_config["division_mode"] == "inline"
+			for child in self.children
+		]
 
 	def is_negative(self):
 		return self.children[0].is_negative() or self.children[1].is_negative()
+
+	@children_first
+	def get_paren_size_class(self):
+		fractions, exponents, tall_symbols = super().get_paren_size_class()
+		if self.mode == "fraction":
+			fractions += 1
+		return fractions, exponents, tall_symbols
 	
+	@memoized_compute
 	def compute(self):
-		num = self.children[0].compute()
-		den = self.children[1].compute()
-		if den == 0:
-			raise ZeroDivisionError
-		if num % den == 0:
-			return int(num / den)
-		else:
-			return float(num) / float(den)
+		return divide(self.children[0].compute(), self.children[1].compute())
+
+	def get_code(self, child_codes, constant):
+		return f"{constant(divide)}({child_codes[0]}, {child_codes[1]})"
 
 class Pow(Operation):
+	__slots__ = ()
+	eval_op = staticmethod(power)
+
 	def __init__(self, *children, **kwargs):
-		self.eval_op = lambda x,y: x**y
 		super().__init__("^", 0, *children, **kwargs)
 
-	def auto_parentheses(self):
+	def get_child_parentheses(self):
 		assert len(self.children) == 2 #idc how to auto paren power towers
-		if isinstance(self.children[0], Operation) or self.children[0].is_negative():
-			self.children[0].give_parentheses()
-		for child in self.children:
-			child.auto_parentheses()
+		return [isinstance(self.children[0], Operation) or self.children[0].is_negative(), False]
 
 	def is_negative(self):
 		return False
 
+	@children_first
+	def get_paren_size_class(self):
+		# Exponents are set in script style, so a fraction or big operator up there only counts as another level
+		base_fractions, base_exponents, base_tall_symbols = self.children[0].get_paren_size_class()
+		exp_fractions, exp_exponents, exp_tall_symbols = self.children[1].get_paren_size_class()
+		return base_fractions, max(base_exponents, 1 + exp_fractions + exp_exponents), base_tall_symbols
+
 
 class Negative(Expression):
+	__slots__ = ()
+
 	def __init__(self, child, **kwargs):
 		self.children = [Smarten(child)]
 		super().__init__(**kwargs)
@@ -116,13 +183,24 @@ class Negative(Expression):
 	def __str__(self):
 		return "-" + str(self.children[0])
 
-	def auto_parentheses(self):
-		if isinstance(self.children[0], (Add, Sub)) or self.children[0].is_negative():
-			self.children[0].give_parentheses()
-		self.children[0].auto_parentheses()
+	def get_child_parentheses(self):
+		return [isinstance(self.children[0], (Add, Sub)) or self.children[0].is_negative()]
 
 	def is_negative(self):
 		return True
 
+	def get_inner_glyph_count(self, child_glyph_counts):
+		return 1 + child_glyph_counts[0]
+
+	def get_glyph_layout(self, child_glyph_counts):
+		return [1], []
+
+	@memoized_compute
 	def compute(self):
 		return -self.children[0].compute()
+
+	def compute_vectorized(self, child_value):
+		return -child_value
+
+	def get_code(self, child_codes, constant):
+		return f"-{child_codes[0]}"
@@ -1,7 +1,10 @@
 from .expression_core import *
+import operator
 
 
 class Relation(Combiner):
+	__slots__ = ()
+
 	def __init__(self, symbol, symbol_glyph_length, *children, **kwargs):
 		super().__init__(symbol, symbol_glyph_length, *children, **kwargs)
 	
@@ -10,27 +13,37 @@ class Relation(Combiner):
 
 
 class Equation(Relation):
+	__slots__ = ()
+	eval_op = staticmethod(lambda X,Y: X.exactly_equals(Y))
+
 	def __init__(self, *children, **kwargs):
-		self.eval_op = lambda X,Y: X.exactly_equals(Y)
 		super().__init__("=", 1, *children, **kwargs)
 
 class LessThan(Relation):
+	__slots__ = ()
+	eval_op = staticmethod(operator.lt)
+
 	def __init__(self, *children, **kwargs):
-		self.eval_op = lambda X,Y: X < Y
 		super().__init__("<", 1, *children, **kwargs)
 
 class GreaterThan(Relation):
+	__slots__ = ()
+	eval_op = staticmethod(operator.gt)
+
 	def __init__(self, *children, **kwargs):
-		self.eval_op = lambda X,Y: X > Y
 		super().__init__(">", 1, *children, **kwargs)
 
 class LessThanOrEqualTo(Relation):
+	__slots__ = ()
+	eval_op = staticmethod(operator.le)
+
 	def __init__(self, *children, **kwargs):
-		self.eval_op = lambda X,Y: X <= Y
 		super().__init__("\\leq", 1, *children, **kwargs)
 
 class GreaterThanOrEqualTo(Relation):
+	__slots__ = ()
+	eval_op = staticmethod(operator.ge)
+
 	def __init__(self, *children, **kwargs):
-		self.eval_op = lambda X,Y: X >= Y
 		super().__init__("\\geq", 1, *children, **kwargs)
 
@@ -2,6 +2,15 @@ from .expression_core import *
 
 
 class Sequence(Combiner):
+	__slots__ = ("generator",)
+
 	def __init__(self, *children, generator=None, **kwargs):
 		self.generator = generator
 		super().__init__(",", 1, *children, **kwargs)
+
+	def compute_vectorized(self, *child_values):
+		# Handed to a Function as its arguments
+		return child_values
+
+	def get_code(self, child_codes, constant):
+		return "(" + "".join(code + ", " for code in child_codes) + ")"
@@ -2,6 +2,8 @@ from .expression_core import *
 
 
 class Variable(Expression):
+	__slots__ = ("symbol",)
+
 	def __init__(self, symbol, **kwargs):
 		self.symbol = symbol
 		self.children = []
@@ -11,8 +13,14 @@ class Variable(Expression):
 	def __str__(self):
 		return self.symbol
 
-	def is_identical_to(self, other):
-		return type(self) == type(other) and self.symbol == other.symbol
+	def get_inner_glyph_count(self, child_glyph_counts):
+		return tex_glyph_count(self.symbol)
+
+	def get_node_key(self):
+		return (self.symbol,)
+
+	def get_own_variables(self):
+		return frozenset([self])
 
 	def compute(self):
 		raise ValueError(f"Expression contains a variable {self.symbol}.")
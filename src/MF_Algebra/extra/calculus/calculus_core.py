@@ -12,6 +12,8 @@ class Infinity(Real):
 
 
 class Limit(Function):
+    tall_symbol = True
+
     def __init__(self, variable, value, **kwargs):
         self.variable = Smarten(variable)
         self.value = Smarten(value)
@@ -22,6 +24,7 @@ class Limit(Function):
             **kwargs
         )
         self.children += [self.variable, self.value]
+        self.adopt_children()
 
 
 class Differential(Function):
@@ -35,6 +38,8 @@ class Differential(Function):
 
 
 class Integral(Function):
+    tall_symbol = True
+
     def __init__(self, lower_bound=None, upper_bound=None, **kwargs):
         self.bounds = [Smarten(bound) if bound is not None else None for bound in (lower_bound, upper_bound)]
         symbol = "\\int"
@@ -52,6 +57,8 @@ class Integral(Function):
 
 
 class Sum(Function):
+    tall_symbol = True
+
     def __init__(self, variable, lower_bound, upper_bound, **kwargs):
         self.variable = Smarten(variable)
         self.lower_bound = Smarten(lower_bound)
@@ -64,6 +71,7 @@ class Sum(Function):
             **kwargs
         )
         self.children += [self.lower_equation, self.upper_bound]
+        self.adopt_children()
 
 
 
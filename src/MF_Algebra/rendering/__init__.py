@@ -0,0 +1,4 @@
+from .tex_cache import *
+from .tex_batch import *
+from .incremental import *
+from .profiling import *
@@ -0,0 +1,83 @@
+"""
+	Experimental: builds the mobs of expressions laid out in a single row, like sums, inline products
+	and quotients, sequences and relations, out of the already typeset glyphs of their children,
+	so that changing one leaf of a long sum only runs LaTeX for the new leaf.
+
+	Everything is typeset with a "1" in front to find the baseline, which is then removed.
+	The unit itself is braced so that a \\over can't reach the "1" and a leading minus stays unary.
+	Glyphs are kept as (glyph_points, width) with their left edge at x=0 and baseline at y=0.
+	Spacing around each operator is measured once from "1 op 1", so it is whatever TeX uses.
+"""
+import numpy as np
+from .tex_cache import compile_tex, get_glyph_points, mob_from_glyph_points
+
+
+baseline_reference = "1 \\quad "
+typeset_units = {} # tex string: (glyph_points, width)
+operator_layouts = {} # operator symbol: (glyph_points, width, left gap, right gap)
+
+
+def can_assemble(expr):
+	from ..expressions.operations import Add, Sub, Mul, Div
+	from ..expressions.sequences import Sequence
+	from ..expressions.relations import Relation
+	return (
+		isinstance(expr, (Add, Sub, Mul, Div, Sequence, Relation))
+		and not (isinstance(expr, Div) and expr.mode == "fraction")
+		and expr.symbol_glyph_length > 0 # juxtaposed products space differently around parentheses
+		and not expr.parentheses
+		and len(expr.children) > 0
+	)
+
+
+def assemble_mob(expr):
+	glyph_points, width = assemble(expr)
+	all_points = np.concatenate([points for points in glyph_points if len(points)])
+	middle = (all_points.max(axis=0) + all_points.min(axis=0)) / 2
+	return mob_from_glyph_points([points - middle for points in glyph_points])
+
+
+def assemble(expr):
+	if not can_assemble(expr):
+		return typeset_unit(expr.get_tex_string())
+	op_points, op_width, left_gap, right_gap = get_operator_layout(expr.symbol)
+	glyph_points = []
+	cursor = 0
+	for n, child in enumerate(expr.children):
+		if n > 0:
+			cursor += left_gap
+			glyph_points += [points + [cursor, 0, 0] for points in op_points]
+			cursor += op_width + right_gap
+		child_points, child_width = assemble(child)
+		glyph_points += [points + [cursor, 0, 0] for points in child_points]
+		cursor += child_width
+	return glyph_points, cursor
+
+
+def typeset_unit(string):
+	if string not in typeset_units:
+		reference, *glyph_points = get_glyph_points(compile_tex(baseline_reference + "{" + string + "}"))
+		typeset_units[string] = normalize(glyph_points, reference[:,1].min())
+	return typeset_units[string]
+
+
+def get_operator_layout(symbol):
+	if symbol not in operator_layouts:
+		left, *op_glyphs, right = get_glyph_points(compile_tex("1 " + symbol + " 1"))
+		op_left = min(points[:,0].min() for points in op_glyphs)
+		op_right = max(points[:,0].max() for points in op_glyphs)
+		op_points, op_width = normalize(op_glyphs, left[:,1].min())
+		operator_layouts[symbol] = (
+			op_points,
+			op_width,
+			op_left - left[:,0].max(),
+			right[:,0].min() - op_right
+		)
+	return operator_layouts[symbol]
+
+
+def normalize(glyph_points, baseline):
+	# Moves the glyphs to start at x=0 and sit on y=0, returning them along with their width
+	all_points = np.concatenate([points for points in glyph_points if len(points)])
+	left, right = all_points[:,0].min(), all_points[:,0].max()
+	return [points - [left, baseline, 0] for points in glyph_points], right - left
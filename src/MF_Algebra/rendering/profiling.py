@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+from contextlib import contextmanager
+
+
+package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+rendering_directory = os.path.dirname(os.path.abspath(__file__))
+
+# Methods a compile gets attributed to, if one of them is on the stack. The outermost one wins,
+# so a compile from measuring parentheses while coloring is put down to set_color_by_subex.
+attributed_methods = {
+	"init_mob",
+	"__len__",
+	"paren_length",
+	"set_color_by_subex",
+	"create_graph",
+	"compile_many",
+	"precompile",
+}
+
+active_profiles = []
+
+
+class TexProfile:
+	"""
+		Collects an event for every LaTeX run and every Tex cache lookup made while it is active.
+		Each event is a dict with
+			kind: "compile" (one string), "batch" (one run for many strings), "pool" (batches in worker
+				processes), "cache_hit" or "cache_miss"
+			strings: how many Tex strings it covered
+			seconds: wall time it took
+			site: the method it is attributed to, see attributed_methods
+			stack: every MF_Algebra function on the stack at the time, innermost first
+	"""
+	def __init__(self):
+		self.events = []
+
+	def record(self, event):
+		self.events.append(event)
+
+	def count(self, kind):
+		return sum(event["strings"] for event in self.events if event["kind"] == kind)
+
+	@property
+	def compiles(self):
+		# Number of LaTeX runs
+		return len([event for event in self.events if event["kind"] in ("compile", "batch")])
+
+	@property
+	def cache_hits(self):
+		return self.count("cache_hit")
+
+	@property
+	def cache_misses(self):
+		return self.count("cache_miss")
+
+	@property
+	def seconds(self):
+		return sum(event["seconds"] for event in self.events)
+
+	def summary(self):
+		# Totals per (site, kind)
+		rows = {}
+		for event in self.events:
+			row = rows.setdefault((event["site"], event["kind"]), {"events": 0, "strings": 0, "seconds": 0.0})
+			row["events"] += 1
+			row["strings"] += event["strings"]
+			row["seconds"] += event["seconds"]
+		return [
+			{"site": site, "kind": kind, **row}
+			for (site, kind), row in sorted(rows.items(), key=lambda item: -item[1]["seconds"])
+		]
+
+	def table(self):
+		lines = [f"{'site':<36}{'kind':<12}{'events':>8}{'strings':>9}{'seconds':>10}"]
+		for row in self.summary():
+			lines.append(f"{row['site']:<36}{row['kind']:<12}{row['events']:>8}{row['strings']:>9}{row['seconds']:>10.3f}")
+		lines.append(f"{'total':<36}{'':<12}{len(self.events):>8}{'':>9}{self.seconds:>10.3f}")
+		return "\n".join(lines)
+
+	def to_json(self, include_events=False, **kwargs):
+		data = {
+			"compiles": self.compiles,
+			"cache_hits": self.cache_hits,
+			"cache_misses": self.cache_misses,
+			"seconds": self.seconds,
+			"summary": self.summary(),
+		}
+		if include_events:
+			data["events"] = self.events
+		return json.dumps(data, **kwargs)
+
+	def __str__(self):
+		return self.table()
+
+
+@contextmanager
+def profile():
+	"""
+		with MF_Algebra.profile() as p:
+			timeline.play_all(self)
+		print(p.table())
+	"""
+	tex_profile = TexProfile()
+	active_profiles.append(tex_profile)
+	try:
+		yield tex_profile
+	finally:
+		active_profiles.remove(tex_profile)
+
+
+def record_tex_event(kind, seconds, strings=1):
+	if not active_profiles:
+		return
+	stack = get_call_stack()
+	attributed = [name for name in stack if name.split(".")[-1] in attributed_methods]
+	event = {
+		"kind": kind,
+		"strings": strings,
+		"seconds": seconds,
+		"site": attributed[-1] if attributed else (stack[0] if stack else "<outside MF_Algebra>"),
+		"stack": stack,
+	}
+	for tex_profile in active_profiles:
+		tex_profile.record(event)
+
+
+def get_call_stack():
+	# Names of the MF_Algebra functions between the caller of the rendering code and the user's code
+	names = []
+	frame = sys._getframe(1)
+	while frame is not None:
+		filename = os.path.abspath(frame.f_code.co_filename)
+		if filename.startswith(rendering_directory):
+			pass
+		elif filename.startswith(package_directory):
+			owner = frame.f_locals.get("self")
+			name = frame.f_code.co_name
+			names.append(type(owner).__name__ + "." + name if owner is not None else name)
+		elif names:
+			break
+		frame = frame.f_back
+	return names
@@ -0,0 +1,188 @@
+import os
+import re
+import subprocess
+import time
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from MF_Tools.dual_compatibility import SVGMobject
+import numpy as np
+from .tex_cache import compile_tex, get_tex_cache, get_tex_settings, get_tex_template_id, get_glyph_points, mob_from_glyph_points
+from .profiling import record_tex_event
+
+
+# Compiled with every batch, and once on its own per Tex template, to find how to scale the batch's glyphs like Tex does
+reference_string = "1"
+reference_glyph_points = {}
+
+
+def compile_tex_strings(strings):
+	"""
+		Returns a dict from each of the given Tex strings to its list of glyph points.
+		Strings found in the Tex cache are not compiled again, and all the others are
+		typeset together in a single LaTeX run, one page per string.
+	"""
+	results = {}
+	cache = get_tex_cache()
+	missing = []
+	for string in dict.fromkeys(strings):
+		glyph_points = None
+		if cache is not None:
+			start = time.perf_counter()
+			glyph_points = cache.get(string)
+			record_tex_event("cache_miss" if glyph_points is None else "cache_hit", time.perf_counter() - start)
+		if glyph_points is None:
+			missing.append(string)
+		else:
+			results[string] = glyph_points
+	if missing:
+		# Worker processes start with the default Tex template, so the one in use here is sent along with each chunk,
+		# and any chunk which fails is compiled string by string here rather than there
+		settings = get_tex_settings()
+		reference = get_reference_glyph_points()
+		workers = min(get_tex_workers(), len(missing))
+		if workers > 1:
+			chunks = [missing[i::workers] for i in range(workers)]
+			compiled = {}
+			start = time.perf_counter()
+			pool = get_executor(workers)
+			futures = [pool.submit(typeset_batch, chunk, settings, reference) for chunk in chunks]
+			for chunk, future in zip(chunks, futures):
+				try:
+					compiled.update(future.result())
+				except (OSError, subprocess.CalledProcessError):
+					compiled.update(compile_each(chunk))
+			record_tex_event("pool", time.perf_counter() - start, strings=len(missing))
+		else:
+			compiled = typeset_or_compile_each(missing, settings, reference)
+		for string, glyph_points in compiled.items():
+			if cache is not None:
+				cache.put(string, glyph_points)
+			results[string] = glyph_points
+	return results
+
+
+def typeset_or_compile_each(strings, settings, reference):
+	try:
+		return typeset_batch(strings, settings, reference)
+	except (OSError, subprocess.CalledProcessError):
+		# One bad string fails the whole run, so fall back to compiling them one at a time
+		return compile_each(strings)
+
+
+def compile_each(strings):
+	return {string: get_glyph_points(compile_tex(string)) for string in strings}
+
+
+def get_reference_glyph_points():
+	template_id = get_tex_template_id()
+	if template_id not in reference_glyph_points:
+		reference_glyph_points[template_id] = get_glyph_points(compile_tex(reference_string))
+	return reference_glyph_points[template_id]
+
+
+def get_tex_workers():
+	from ..expressions.expression_core import algebra_config
+	return algebra_config["tex_workers"] or 1
+
+
+executor = None
+executor_workers = 0
+
+def get_executor(workers):
+	# Worker processes are spawned rather than forked, so they don't inherit an OpenGL context,
+	# and kept around between calls since each one has to import manim.
+	global executor, executor_workers
+	if executor is None or executor_workers != workers:
+		if executor is not None:
+			executor.shutdown()
+		executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+		executor_workers = workers
+	return executor
+
+
+def typeset_batch(strings, settings, reference):
+	# settings as from get_tex_settings, and reference the glyph points of reference_string compiled on its own with them
+	preamble = re.sub(r"\\documentclass(\[.*?\])?\{.*?\}", "", settings["preamble"])
+	pages = [reference_string] + list(strings)
+	document = "\n".join([
+		"\\documentclass{article}",
+		"\\usepackage[active,tightpage]{preview}",
+		"\\PreviewEnvironment{align*}",
+		preamble,
+		"\\begin{document}",
+		*["\\begin{align*}\n" + page + "\n\\end{align*}" for page in pages],
+		"\\end{document}",
+	])
+	with tempfile.TemporaryDirectory() as directory:
+		with open(os.path.join(directory, "batch.tex"), "w") as tex_file:
+			tex_file.write(document)
+		compiler = settings["compiler"]
+		if compiler == "xelatex":
+			compile_command, dvi_name = [compiler, "-no-pdf"], "batch.xdv"
+		else:
+			compile_command, dvi_name = [compiler], "batch.dvi"
+		start = time.perf_counter()
+		subprocess.run(
+			compile_command + ["-interaction=batchmode", "-halt-on-error", "batch.tex"],
+			cwd=directory, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+		)
+		subprocess.run(
+			["dvisvgm", dvi_name, "--no-fonts", "--page=1-", "--output=page-%9p.svg"],
+			cwd=directory, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+		)
+		record_tex_event("batch", time.perf_counter() - start, strings=len(pages))
+		page_points = []
+		for page in range(1, len(pages) + 1):
+			svg = SVGMobject(os.path.join(directory, f"page-{page:09d}.svg"), height=None)
+			page_points.append([np.array(get_points(glyph)) for glyph in svg.family_members_with_points()])
+	scale = get_height(reference) / get_height(page_points[0])
+	return {
+		string: center(scale_glyphs(glyph_points, scale))
+		for string, glyph_points in zip(strings, page_points[1:])
+	}
+
+
+def compile_many(expressions):
+	"""
+		Gives every expression without a mob one from a single batched LaTeX run.
+		Parenthesis sizes they will need for glyph indexing are measured in the same run.
+	"""
+	from ..expressions.expression_core import paren_length_cache, get_paren_measurement_string, get_paren_length
+	pending = [expr for expr in expressions if expr is not None and expr._mob is None]
+	size_classes = set()
+	for expr in pending:
+		for subex in expr.flat_tree.nodes:
+			if subex.parentheses:
+				size_classes.add(subex.get_paren_size_class())
+	size_classes = [size_class for size_class in size_classes if size_class not in paren_length_cache]
+	paren_strings = {size_class: get_paren_measurement_string(size_class) for size_class in size_classes}
+	strings = [expr.get_tex_string() for expr in pending]
+	compiled = compile_tex_strings(strings + [string for string, _ in paren_strings.values()])
+	for size_class, (string, content_glyphs) in paren_strings.items():
+		# A count that doesn't check out is left for measure_paren_length to find on its own
+		paren_length = get_paren_length(len(compiled[string]), content_glyphs)
+		if paren_length is not None:
+			paren_length_cache[size_class] = paren_length
+	for expr, string in zip(pending, strings):
+		expr.set_mob(mob_from_glyph_points(compiled[string]))
+	return expressions
+
+
+def get_points(mob):
+	return mob.get_points() if hasattr(mob, "get_points") else mob.points
+
+
+def get_height(glyph_points):
+	all_points = np.concatenate([points for points in glyph_points if len(points)])
+	return all_points[:,1].max() - all_points[:,1].min()
+
+
+def scale_glyphs(glyph_points, scale):
+	return [points * scale for points in glyph_points]
+
+
+def center(glyph_points):
+	all_points = np.concatenate([points for points in glyph_points if len(points)])
+	middle = (all_points.max(axis=0) + all_points.min(axis=0)) / 2
+	return [points - middle for points in glyph_points]
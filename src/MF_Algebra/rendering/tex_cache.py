@@ -0,0 +1,196 @@
+import os
+import hashlib
+import time
+import tempfile
+from contextlib import contextmanager
+from MF_Tools.dual_compatibility import dc_Tex as Tex, MANIM_TYPE, VGroup, VMobject, WHITE
+import numpy as np
+from .profiling import record_tex_event
+try:
+	import fcntl
+except ImportError: # Windows, where the cache still works but without cross-process locking
+	fcntl = None
+
+
+class TexCache:
+	"""
+		A content-addressed store of compiled Tex on disk, shared by every process on the machine.
+
+		Each entry is keyed by the exact string given to Tex, the manim backend, and the Tex template,
+		and holds the path points of every glyph, from which the mobject can be rebuilt without LaTeX.
+		Entries are single .npz files, written atomically. Reading one bumps its mtime, and when the
+		directory grows past max_bytes the least recently used entries are deleted, under a file lock
+		so that parallel render workers don't trip over each other.
+	"""
+	evict_every = 64 # puts between checks of the directory size
+
+	def __init__(self, directory=None, max_bytes=256*2**20):
+		self.directory = directory or get_default_tex_cache_dir()
+		self.max_bytes = max_bytes
+		self.puts_since_evict = self.evict_every # check on the first put
+		os.makedirs(self.directory, exist_ok=True)
+
+	def get_path(self, string):
+		key = "\n".join([MANIM_TYPE, get_tex_template_id(), string])
+		return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".npz")
+
+	def get(self, string):
+		# Returns the list of glyph points, or None on a miss
+		path = self.get_path(string)
+		try:
+			with np.load(path) as data:
+				glyph_points = [data[f"arr_{i}"] for i in range(len(data.files))]
+			os.utime(path)
+		except (FileNotFoundError, OSError, ValueError): # missing, evicted meanwhile, or half-written by a crash
+			return None
+		return glyph_points
+
+	def put(self, string, glyph_points):
+		path = self.get_path(string)
+		with self.lock():
+			handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+			with os.fdopen(handle, "wb") as file:
+				np.savez(file, *glyph_points)
+			os.replace(temp_path, path)
+			self.puts_since_evict += 1
+			if self.puts_since_evict >= self.evict_every:
+				self.puts_since_evict = 0
+				self.evict()
+
+	def evict(self):
+		# Deletes least recently used entries until the cache is back under 90% of max_bytes.
+		# Must be called while holding the lock.
+		entries = []
+		for entry in os.scandir(self.directory):
+			if entry.name.endswith(".npz"):
+				stat = entry.stat()
+				entries.append((stat.st_mtime, stat.st_size, entry.path))
+		total = sum(size for _, size, _ in entries)
+		if total <= self.max_bytes:
+			return
+		for mtime, size, path in sorted(entries):
+			if total <= 0.9 * self.max_bytes:
+				break
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+			total -= size
+
+	def clear(self):
+		with self.lock():
+			for entry in os.scandir(self.directory):
+				if entry.name.endswith(".npz"):
+					os.remove(entry.path)
+
+	@contextmanager
+	def lock(self):
+		with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+			if fcntl is not None:
+				fcntl.flock(lock_file, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				if fcntl is not None:
+					fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_tex_settings():
+	# The compiler and preamble which the current backend compiles Tex with, as far as we can tell
+	settings = {
+		"compiler": "latex",
+		"preamble": "\\usepackage{amsmath}\n\\usepackage{amssymb}",
+	}
+	try:
+		if MANIM_TYPE == 'CE':
+			from manim import config
+			settings["compiler"] = config.tex_template.tex_compiler
+			settings["preamble"] = config.tex_template.preamble
+		else:
+			from manimlib.utils import tex_file_writing
+			if hasattr(tex_file_writing, "get_tex_template_config"): # 1.7 and later
+				from manimlib.config import manim_config
+				template = tex_file_writing.get_tex_template_config(manim_config.tex.template)
+				settings["compiler"] = template["compiler"]
+				settings["preamble"] = template["preamble"]
+			else:
+				tex_config = tex_file_writing.get_tex_config()
+				settings["compiler"] = tex_config["executable"]
+				with open(tex_config["template_file"]) as template_file:
+					settings["preamble"] = template_file.read().split("\\begin{document}")[0]
+	except Exception:
+		pass
+	return settings
+
+
+def get_tex_template_id():
+	# Something which changes whenever the preamble Tex compiles with does
+	return repr(sorted(get_tex_settings().items()))
+
+
+def get_glyph_mobs(mob):
+	if MANIM_TYPE == 'GL':
+		return list(mob)
+	elif MANIM_TYPE == 'CE':
+		return list(mob[0])
+	else:
+		raise Exception(f"Unknown manim type: {MANIM_TYPE}")
+
+
+def get_glyph_points(mob):
+	if MANIM_TYPE == 'GL':
+		return [np.array(glyph.get_points()) for glyph in get_glyph_mobs(mob)]
+	else:
+		return [np.array(glyph.points) for glyph in get_glyph_mobs(mob)]
+
+
+def mob_from_glyph_points(glyph_points):
+	# Rebuilds a mobject which indexes like a freshly compiled Tex
+	glyphs = [
+		VMobject(fill_color=WHITE, fill_opacity=1.0, stroke_width=0).set_points(points)
+		for points in glyph_points
+	]
+	if MANIM_TYPE == 'GL':
+		return VGroup(*glyphs)
+	elif MANIM_TYPE == 'CE':
+		return VGroup(VGroup(*glyphs))
+	else:
+		raise Exception(f"Unknown manim type: {MANIM_TYPE}")
+
+
+tex_cache = None
+
+def get_default_tex_cache_dir():
+	return os.path.join(os.path.expanduser("~"), ".cache", "MF_Algebra", "tex")
+
+
+def get_tex_cache():
+	# The TexCache configured by algebra_config, or None if caching is turned off
+	global tex_cache
+	from ..expressions.expression_core import algebra_config
+	if not algebra_config["tex_cache"]:
+		return None
+	directory = algebra_config["tex_cache_dir"] or get_default_tex_cache_dir()
+	max_bytes = algebra_config["tex_cache_max_bytes"]
+	if tex_cache is None or tex_cache.directory != directory:
+		tex_cache = TexCache(directory, max_bytes)
+	tex_cache.max_bytes = max_bytes
+	return tex_cache
+
+
+def compile_tex(string, **kwargs):
+	# Every Tex the expressions need goes through here.
+	# Only plain calls are cached, since kwargs may change how the glyphs come out.
+	cache = None if kwargs else get_tex_cache()
+	if cache is not None:
+		start = time.perf_counter()
+		glyph_points = cache.get(string)
+		record_tex_event("cache_miss" if glyph_points is None else "cache_hit", time.perf_counter() - start)
+		if glyph_points is not None:
+			return mob_from_glyph_points(glyph_points)
+	start = time.perf_counter()
+	mob = Tex(string, **kwargs)
+	record_tex_event("compile", time.perf_counter() - start)
+	if cache is not None:
+		cache.put(string, get_glyph_points(mob))
+	return mob
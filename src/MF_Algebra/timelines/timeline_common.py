@@ -1,9 +1,10 @@
 from .timeline_core import *
 from .timeline_variants import *
 from ..actions.action_common import evaluate_
+import heapq
 
 class Evaluate(AutoTimeline):
-    def __init__(self, first_expression=None, mode="one at a time", number_mode="float", **kwargs):
+    def __init__(self, first_expression=None, mode="one at a time", number_mode=None, **kwargs):
         self.mode = mode
         self.number_mode = number_mode
         super().__init__(**kwargs)
@@ -12,18 +13,31 @@ class Evaluate(AutoTimeline):
 
     def decide_next_action(self, index: int):
         last_exp = self.get_expression(index)
-        leaves = last_exp.get_all_leaf_addresses()
-        if leaves == ['']:
+        flat_tree = last_exp.flat_tree
+        if len(flat_tree) == 1:
             return None
-        leaves.sort(key=len, reverse=True)
-        for leaf in leaves:
+        # Parents of leaves are tried deepest first, otherwise in address order, each only once.
+        # One which evaluates to what it already shows, like a fraction in exact number mode, is as good as a leaf,
+        # so its own parent is tried in its turn.
+        depths, parents = flat_tree.depths, flat_tree.parents
+        twigs = set(parents[flat_tree.is_leaf].tolist())
+        queue = [(-depths[twig], twig) for twig in twigs]
+        heapq.heapify(queue)
+        while queue:
+            _, twig = heapq.heappop(queue)
+            if not flat_tree.nodes[twig].is_constant:
+                continue
             try:
-                twig = leaf[:-1]
-                action = evaluate_(preaddress=twig)
-                action.get_output_expression(last_exp)
-                return action
+                address = flat_tree.addresses[twig]
+                action = evaluate_(preaddress=address, number_mode=self.number_mode)
+                if str(action.get_output_expression(last_exp).get_subex(address)) != str(flat_tree.nodes[twig]):
+                    return action
             except ValueError:
                 # This should mean that a subexpression cannot be computed due to the presence of a variable.
                 # Perhaps we should make a custom Exception class for this so as not to accidentally catch others.
-                pass
-        return None
\ No newline at end of file
+                continue
+            parent = int(parents[twig])
+            if parent >= 0 and parent not in twigs:
+                twigs.add(parent)
+                heapq.heappush(queue, (-depths[parent], parent))
+        return None
@@ -1,6 +1,7 @@
 from ..expressions import *
 from ..actions import *
 from MF_Tools.dual_compatibility import TransformMatchingShapes, UP, smooth
+from concurrent.futures import ThreadPoolExecutor
 
 
 class Timeline:
@@ -16,10 +17,14 @@ class Timeline:
         past_steps_direction = UP,
         past_steps_buff = 1,
         past_steps_shift_run_time = 1,
-        past_steps_shift_rate_func = smooth
+        past_steps_shift_rate_func = smooth,
+        prefetch = 0
     ):
         self.steps = [] # Elements of this list are of the form [expression, action]
         self.current_exp_index = 0
+        self.prefetch = prefetch # number of upcoming animations to prepare in the background while one plays
+        self.prefetched = {} # index: Future of the mobs and glyph indices for the animation from that index
+        self.prefetch_executor = None
         self.auto_color = auto_color
         self.auto_propagate = auto_propagate
         self.show_past_steps = show_past_steps
@@ -38,6 +43,7 @@ class Timeline:
             return None
     
     def set_expression(self, index: int, expression: Expression):
+        self.discard_prefetched()
         if self.auto_color:
             expression.set_color_by_subex(self.auto_color)
         if index == len(self.steps):
@@ -64,6 +70,7 @@ class Timeline:
             return None
 
     def set_action(self, index: int, action: Action):
+        self.discard_prefetched()
         self.steps[index][1] = action
         if self.auto_propagate:
             self.propagate(start_at=index)
@@ -91,18 +98,62 @@ class Timeline:
             except NotImplementedError:
                 pass
     
-    def play_animation(self, scene, index, **kwargs):
+    def precompile(self):
+        # Typesets every expression of the timeline in one LaTeX run, instead of one run each as they are shown
+        from ..rendering.tex_batch import compile_many
+        compile_many([self.get_expression(i) for i in range(len(self.steps))])
+        return self
+
+    def get_animation(self, index, **kwargs):
         action = self.get_action(index)
         expA = self.get_expression(index)
         expB = self.get_expression(index+1)
-        if self.show_past_steps:
-            self.shift_past_steps(scene, expA, expB)
         if action:
-            animation = action.get_animation()(expA, expB, **kwargs)
+            return action.get_animation()(expA, expB, **kwargs)
         else:
-            animation = TransformMatchingShapes(expA.mob, expB.mob, **kwargs)
+            return TransformMatchingShapes(expA.mob, expB.mob, **kwargs)
+
+    def play_animation(self, scene, index, **kwargs):
+        expA = self.get_expression(index)
+        expB = self.get_expression(index+1)
+        future = self.prefetched.pop(index, None)
+        if future is not None:
+            # Wait for the mobs to be ready, so that only one thread is ever compiling them
+            future.result()
+        # The animation itself is always built here, since the previous play may have been animating expA.mob
+        animation = self.get_animation(index, **kwargs)
+        self.prefetch_after(index)
+        if self.show_past_steps:
+            self.shift_past_steps(scene, expA, expB)
         scene.play(animation)
         self.current_exp_index = index+1
+
+    def prepare_animation(self, index):
+        # Builds what the animation from this index will need, without touching anything on screen
+        for exp in (self.get_expression(index), self.get_expression(index+1)):
+            exp.mob
+            exp.glyph_index
+
+    def prefetch_after(self, index):
+        # Starts building the mobs and glyph indices of the next few animations on a background thread,
+        # one at a time and in order, so they are ready by the time play_next gets to them.
+        if not self.prefetch:
+            return
+        if self.prefetch_executor is None:
+            self.prefetch_executor = ThreadPoolExecutor(1)
+        for i in range(index+1, min(index+1+self.prefetch, len(self.steps)-1)):
+            if i not in self.prefetched:
+                self.prefetched[i] = self.prefetch_executor.submit(self.prepare_animation, i)
+
+    def discard_prefetched(self):
+        # Cancels the prefetches that haven't started and waits out the one that has, before the steps change under it
+        for future in self.prefetched.values():
+            if not future.cancel():
+                try:
+                    future.result()
+                except Exception:
+                    pass # whatever failed will be built again when it is needed
+        self.prefetched.clear()
     
     def play_next(self, scene):
         self.play_animation(scene, index=self.current_exp_index)
@@ -1,5 +1,5 @@
 from MF_Tools.dual_compatibility import (
-	Text, dc_Tex as Tex,
+	Text,
 	UP, DOWN, LEFT, RIGHT,
 	GREEN, BLUE, ORANGE,
 	Indicate,
@@ -7,6 +7,9 @@ from MF_Tools.dual_compatibility import (
 	Line
 )
 import numpy as np
+from functools import wraps
+from fractions import Fraction
+import threading
 
 
 def Smarten(input):
@@ -20,11 +23,78 @@ def Smarten(input):
 		return Integer(input)
 	elif isinstance(input, float):
 		return Real(input)
+	elif isinstance(input, Fraction):
+		from .expressions.numbers import Rational
+		from .expressions.operations import Negative
+		if input.denominator == 1:
+			return Integer(input.numerator)
+		elif input < 0:
+			return Negative(Rational(-input.numerator, input.denominator))
+		else:
+			return Rational(input.numerator, input.denominator)
 	else:
 		raise NotImplementedError(f"Unsupported type {type(input)}")
 
 
+def postorder(expr):
+	# Every subexpression of expr, children before parents and left to right, using a stack rather than recursion
+	stack = [(expr, False)]
+	while stack:
+		subex, expanded = stack.pop()
+		if expanded:
+			yield subex
+		else:
+			stack.append((subex, True))
+			stack.extend((child, False) for child in reversed(subex.children))
+
+
+walk_results = threading.local() # walk_results.by_method maps each method name to the results of its outermost call
+
+def children_first(method):
+	"""
+		For methods like __str__ and compute which call themselves on each child.
+		The outermost call runs the method on every subexpression bottom-up with a stack,
+		keeping each result (or exception), so the calls on children find their answer
+		waiting instead of recursing. Deep expressions then never reach the recursion limit.
+		Calls with arguments are passed straight through.
+	"""
+	name = method.__name__
+	@wraps(method)
+	def wrapper(expr, *args, **kwargs):
+		if args or kwargs:
+			return method(expr, *args, **kwargs)
+		if not hasattr(walk_results, "by_method"):
+			walk_results.by_method = {}
+		results = walk_results.by_method.get(name)
+		if results is not None:
+			if id(expr) in results:
+				succeeded, result = results[id(expr)]
+				if succeeded:
+					return result
+				raise result
+			return method(expr)
+		results = {}
+		walk_results.by_method[name] = results
+		try:
+			for subex in postorder(expr):
+				if id(subex) in results:
+					continue
+				try:
+					results[id(subex)] = (True, getattr(subex, name)())
+				except Exception as error:
+					results[id(subex)] = (False, error)
+			succeeded, result = results[id(expr)]
+			if succeeded:
+				return result
+			raise result
+		finally:
+			del walk_results.by_method[name]
+	return wrapper
+
+
 def tex(func):
+	@children_first
+	@wraps(func)
 	def wrapper(expr, *args, **kwargs):
 		pretex = func(expr, *args, **kwargs)
 		if expr.parentheses:
@@ -54,6 +124,60 @@ def add_spaces_around_brackets(input_string): #GPT
 	return ' '.join(spaced_string)
 
 
+# Glyph counts of the control sequences which may show up in leaf symbols.
+# Anything not listed here has to be rendered to be counted. Only single math characters, and known runs of them
+# like \ldots, belong here: composites like \neq (\not=) and \hbar are left to rendering rather than guessed.
+tex_command_glyph_counts = {
+	**{"\\" + name: 1 for name in (
+		"alpha beta gamma delta epsilon varepsilon zeta eta theta vartheta iota kappa lambda mu nu xi "
+		"pi varpi rho varrho sigma varsigma tau upsilon phi varphi chi psi omega "
+		"Gamma Delta Theta Lambda Xi Pi Sigma Upsilon Phi Psi Omega "
+		"infty partial nabla ell imath jmath cdot times div pm mp leq geq approx to prime"
+	).split()},
+	"\\ldots": 3,
+	"\\cdots": 3,
+	"\\,": 0,
+	"\\:": 0,
+	"\\;": 0,
+	"\\!": 0,
+	"\\ ": 0,
+	"\\quad": 0,
+	"\\qquad": 0,
+}
+
+
+def tex_glyph_count(string):
+	"""
+		Returns the number of glyphs that Tex(string) would have, without compiling it,
+		or None if the string contains something we don't know how to count.
+		Only meant for the short strings of leaves, like 14, -0.6180\\ldots, x or \\theta.
+	"""
+	count = 0
+	i = 0
+	while i < len(string):
+		char = string[i]
+		if char == "\\":
+			j = i + 1
+			while j < len(string) and string[j].isalpha():
+				j += 1
+			if j == i + 1:
+				j += 1 # control symbol like \, or \!
+			command = string[i:j]
+			if command not in tex_command_glyph_counts:
+				return None
+			count += tex_command_glyph_counts[command]
+			i = j
+			continue
+		if char in "{}^_" or char.isspace():
+			pass
+		elif char.isalnum() or char in "+-=<>()[]|/.,;:!?*'":
+			count += 1
+		else:
+			return None
+		i += 1
+	return count
+
+
 def debug_smarttex(scene, smarttex, show_indices=True, show_addresses=True, show_submobjects=True):
 	print("Debugging Expression:")
 	print(smarttex)
@@ -105,27 +229,27 @@ def match_expressions(template, expression):
 		Ok I think I've done it!
 	"""
 	from .expressions.variables import Variable
-	# Leaf case
-	if not template.children:
-		if isinstance(template, Variable):
-			return {template: expression}
-		elif template.is_identical_to(expression):
-			return {}
-		else:
-			raise ValueError("Expressions do not match")
-	
-	# Node case
+	# Walks both trees together with a stack of pairs still to be matched
 	var_dict = {}
-	if not isinstance(expression, type(template)):
-		raise ValueError("Expressions do not match type")
-	if not len(template.children) == len(expression.children):
-		raise ValueError("Expressions do not match children length")
-	for tc,ec in zip(template.children, expression.children):
-		child_dict = match_expressions(tc,ec)
-		matching_keys = child_dict.keys() & var_dict.keys()
-		if any(not child_dict[key].is_identical_to(var_dict[key]) for key in matching_keys):
-			raise ValueError("Conflicting matches for " + str(matching_keys))
-		var_dict.update(child_dict)
+	stack = [(template, expression)]
+	while stack:
+		template, expression = stack.pop()
+		# Leaf case
+		if not template.children:
+			if isinstance(template, Variable):
+				if template in var_dict and not var_dict[template].is_identical_to(expression):
+					raise ValueError("Conflicting matches for " + str(template))
+				var_dict[template] = expression
+			elif not template.is_identical_to(expression):
+				raise ValueError("Expressions do not match")
+			continue
+
+		# Node case
+		if not isinstance(expression, type(template)):
+			raise ValueError("Expressions do not match type")
+		if not len(template.children) == len(expression.children):
+			raise ValueError("Expressions do not match children length")
+		stack.extend(reversed(list(zip(template.children, expression.children))))
 
 	return var_dict
 
@@ -140,11 +264,11 @@ def random_number_expression(leaves=range(-5, 10), max_depth=3, max_children_per
 		if np.random.random() < 1 / (current_depth + 1):
 			return Integer(random.choice(leaves))
 		else:
-			return random_number_expression(leaves, max_depth - 1)
+			return random_number_expression(leaves, max_depth - 1, max_children_per_node)
 	def generate_children(current_depth, number_of_children):
 		return [generate_child(current_depth) for _ in range(number_of_children)]
 	if node == Add or node == Mul:
-		children = generate_children(max_depth, random.choice(list(range(2,max_children_per_node))))
+		children = generate_children(max_depth, random.choice(list(range(2, max_children_per_node + 1))))
 	elif node == Negative:
 		children = generate_children(max_depth, 1)
 	else:
@@ -153,7 +277,7 @@ def random_number_expression(leaves=range(-5, 10), max_depth=3, max_children_per
 
 
 def create_graph(expr, node_size=0.5, horizontal_buff=1, vertical_buff=1.5, printing=False):
-	def create_node(address):
+	def get_node_symbol(subex):
 		from .expressions.numbers import Integer, Real, Rational
 		from .expressions.variables import Variable
 		from .expressions.operations import Add, Sub, Mul, Div, Pow, Negative
@@ -179,31 +303,26 @@ def create_graph(expr, node_size=0.5, horizontal_buff=1, vertical_buff=1.5, prin
 			GreaterThan: lambda expr: ">",
 			GreaterThanOrEqualTo: lambda expr: "\\geq",
 		}
-		subex = expr.get_subex(address)
-		symbol = type_to_symbol_dict[type(subex)](subex)
-		tex = Tex(symbol)
-		# if tex.width > tex.height:
-		# 	tex.scale_to_fit_width(node_size)
-		# else:
-		# 	tex.scale_to_fit_height(node_size)
-		return tex
-	addresses = expr.get_all_addresses()
+		return type_to_symbol_dict[type(subex)](subex)
+	flat_tree = expr.flat_tree
+	addresses = flat_tree.addresses
+	# All the node symbols are typeset together, in parallel if algebra_config["tex_workers"] is set
+	from .rendering.tex_batch import compile_tex_strings, mob_from_glyph_points
+	symbols = {ad: get_node_symbol(subex) for ad, subex in zip(addresses, flat_tree.nodes)}
+	compiled_symbols = compile_tex_strings(list(symbols.values()))
 	if printing: print(addresses)
-	max_length = max(len(address) for address in addresses)
-	layered_addresses = [
-		[ad for ad in addresses if len(ad) == i]
-		for i in range(max_length + 1)
-	]
+	layered_addresses = [[addresses[i] for i in level] for level in flat_tree.get_levels()]
+	max_length = len(layered_addresses) - 1
 	if printing: print(layered_addresses)
 	max_index = max(range(len(layered_addresses)), key=lambda i: len(layered_addresses[i]))
 	max_layer = layered_addresses[max_index]
 	max_width = len(max_layer)
 	if printing: print(max_index, max_width, max_layer)
-	Nodes = VDict({ad: create_node(ad) for ad in addresses})
+	Nodes = VDict({ad: mob_from_glyph_points(compiled_symbols[symbols[ad]]) for ad in addresses})
 	#Max_layer = VGroup(*[Nodes[ad] for ad in max_layer]).arrange(RIGHT,buff=horizontal_buff)
 	def position_children(parent_address):
 		parent = Nodes[parent_address]
-		child_addresses = [ad for ad in layered_addresses[len(parent_address)+1] if ad[:-1] == parent_address]
+		child_addresses = [addresses[i] for i in flat_tree.get_children(flat_tree.get_index(parent_address))]
 		if printing: print(child_addresses)
 		child_Nodes = VGroup(*[Nodes[ad] for ad in child_addresses]).arrange(RIGHT,buff=1)
 		child_Nodes.move_to(parent.get_center()+DOWN*vertical_buff)
@@ -211,7 +330,8 @@ def create_graph(expr, node_size=0.5, horizontal_buff=1, vertical_buff=1.5, prin
 		for ad in layered_addresses[i]:
 			position_children(ad)
 	def position_parent(child_address):
-		sibling_Nodes = VGroup(*[Nodes[ad] for ad in layered_addresses[len(child_address)] if ad[:-1] == child_address[:-1]])
+		parent_index = flat_tree.parents[flat_tree.get_index(child_address)]
+		sibling_Nodes = VGroup(*[Nodes[addresses[i]] for i in flat_tree.get_children(parent_index)])
 		parent_Node = Nodes[child_address[:-1]]
 		parent_Node.move_to(sibling_Nodes.get_center()+UP*vertical_buff)
 	for i in range(max_index, 0, -1):
@@ -136,7 +136,44 @@ def test_add_Q(a,Q):
 
 def test_add_B(a,B):
     assert a.get_output_expression(B).is_identical_to((2*x+y)/(x-25*y**3) + t)
-    
+
+def test_persistent_trees(B):
+    actions = [swap_children_(preaddress="1"), mul_(-1, preaddress="10"), add_(3, preaddress="0"), substitute_({x: -2}, preaddress="1"), swap_children_(preaddress="10")]
+    def run():
+        outputs = [B]
+        for action in actions:
+            outputs.append(action.get_output_expression(outputs[-1]))
+        return outputs
+    copied = run()
+    algebra_config["persistent_trees"] = True
+    try:
+        shared = run()
+    finally:
+        algebra_config["persistent_trees"] = False
+    for C, P in zip(copied, shared):
+        assert str(C) == str(P) and len(C) == len(P)
+    assert shared[1].children[0] is B.children[0]
+    assert shared[2].children[1].children[1] is shared[1].children[1].children[1]
+    assert str(B) == str((2*x+y)/(x-25*y**3))
+
+def test_persistent_parent_links():
+    def has_parent(subex, parent):
+        return len([ref for ref in subex._parents if ref() is parent]) > 0
+    algebra_config["persistent_trees"] = True
+    try:
+        s = x+1
+        M = Mul(s, 3) # s needs parentheses here, so M holds a copy of it
+        assert M.children[0] is not s and has_parent(M.children[0], M) and not has_parent(s, M)
+        M.mob
+        M.children[0].invalidate()
+        assert M._mob is None
+        E = (x+1)*(y+2)
+        for R in [E.replace_at_address(Integer(5), "00"), E.substitute({x: 5})]:
+            assert has_parent(R.children[0], R) and not has_parent(E.children[0], R)
+            assert not has_parent(E.get_subex("00"), R.children[0])
+    finally:
+        algebra_config["persistent_trees"] = False
+
 # s = swap_children_()
 # Q = (x/y)**2
 # test_swap_children_Q(s,Q)
\ No newline at end of file
@@ -12,6 +12,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 from manimlib import *
 from MF_Algebra.expressions import *
+from MF_Algebra.utils import match_expressions
 
 @pytest.fixture
 def Q(): #simple rational exp
@@ -247,13 +248,246 @@ def test_glyph_indices_function(F):
     assert F.get_glyphs("10") == [16]
     assert F.get_glyphs("100") == [16]
 
+def test_glyph_count_matches_render(Q,B,S,F):
+    for expr in [Q,B,S,F]:
+        for ad in expr.get_all_addresses():
+            subex = expr.get_subex(ad).copy()
+            assert subex.glyph_count() == subex.get_rendered_glyph_count()
+
+def test_paren_size_class(Q,B):
+    assert x.get_paren_size_class() == (0,0,())
+    assert Q.get_subex("0").get_paren_size_class() == (1,0,())
+    assert Q.get_paren_size_class() == (1,1,())
+    assert B.get_subex("000").get_paren_size_class() == (1,1,())
+    assert B.get_subex("0").get_paren_size_class() == (2,1,())
+    assert B.get_subex("0").paren_length() == 3
+    assert B.get_subex("000").paren_length() == 1
+    from MF_Algebra.extra.calculus import Integral, Sum
+    from MF_Algebra.expressions.expression_core import get_paren_measurement_string
+    I = Integral()(x)
+    assert I.get_paren_size_class() == (0,0,(("\\int",1),))
+    sigma = Sum(Variable("n"),1,9)
+    assert (I/2 + sigma(x)).get_paren_size_class() == (1,0,tuple(sorted([("\\int",1), (sigma.symbol, sigma.symbol_glyph_length)])))
+    assert (2**I).get_paren_size_class() == (0,1,())
+    assert "\\int" in get_paren_measurement_string(I.get_paren_size_class())[0]
+
+def test_invalidation(Q,B):
+    mob = Q.mob
+    index = Q.glyph_index
+    Q.reset_parentheses()
+    assert Q._mob is mob and Q._glyph_index is index
+    B.get_subex("00").mob
+    B.mob
+    B.get_subex("000").give_parentheses(False)
+    assert B._mob is None and B._glyph_index is None
+    assert B.get_subex("00")._mob is None
+    copied = Q.copy()
+    mob = copied.mob
+    copied.get_subex("0").give_parentheses(False)
+    assert copied._mob is None
+    assert len(copied) == len(Q) - 2
+    assert Q._mob is not None
+
+def test_batched_invalidation_per_thread(Q):
+    import threading
+    Q.mob
+    with Expression.batched_invalidation() as changed:
+        worker = threading.Thread(target=Q.get_subex("0").give_parentheses, args=(False,))
+        worker.start()
+        worker.join()
+        assert Q._mob is None and changed == []
+
+def test_copy_leaves_mob(B,F):
+    B.mob
+    copied = B.copy()
+    assert copied._mob is None and copied == B
+    assert copied.get_subex("0") is not B.get_subex("0")
+    assert len(copied.mob) == len(B.mob)
+    with_mob = B.copy_with_mob()
+    assert with_mob._mob is not None and with_mob._mob is not B._mob
+    G = F.copy()
+    assert G == F and G.children[0].children[0]._parents[0]() is G.children[0]
+
+def test_flat_tree(B,F):
+    tree = F.flat_tree
+    assert tree.addresses[:4] == ["", "0", "00", "000"]
+    assert F.get_all_leaf_addresses() == ["000", "001", "00200", "00201", "00210", "00211", "100"]
+    assert F.get_all_nonleaf_addresses() == ["", "0", "00", "002", "0020", "0021", "1", "10"]
+    assert [tree.addresses[i] for i in tree.get_children(tree.get_index("00"))] == ["000", "001", "002"]
+    assert tree.ends[0] == len(tree) and list(tree.depths) == [len(ad) for ad in tree.addresses]
+    assert B.flat_tree is B.flat_tree
+    B.get_subex("00").invalidate()
+    assert B._flat_tree is None
+
+def test_walk(F):
+    assert [ad for ad, subex in F.walk()] == F.get_all_addresses()
+    assert [ad for ad, subex in F.walk("post")] == ["000", "001", "00200", "00201", "0020", "00210", "00211", "0021", "002", "00", "0", "100", "10", "1", ""]
+    assert [ad for ad, subex in F.walk("bfs")] == sorted(F.get_all_addresses(), key=len)
+    assert [ad for ad, subex in F.walk(where=lambda subex: not subex.children)] == F.get_all_leaf_addresses()
+    assert next(F.walk("post", where=lambda subex: isinstance(subex, Variable)))[1] is x
+    with pytest.raises(ValueError):
+        F.walk("sideways")
+
+def test_subtree_index(B):
+    assert B.get_addresses_of_subex(x) == ["000001", "00010", "010001", "01010"]
+    assert B.get_addresses_of_subex(2*x+y) == ["0000", "0100"]
+    assert B.get_addresses_of_subex(y**3) == ["000111", "010111"]
+    assert B.get_addresses_of_subex(z) == []
+    index = B.flat_tree.get_subtree_index()
+    assert sorted(i for indices in index.values() for i in indices) == list(range(len(B.flat_tree)))
+
+def test_structural_hash(Q,B,F):
+    assert Variable("a") == Variable("a") and len({Variable("a"), Variable("a"), a}) == 1
+    assert {x: 1}[Variable("x")] == 1
+    assert Q == (x/y)**2 and hash(Q) == hash((x/y)**2)
+    assert Q != (x/y)**3 and Q != x and Q != None
+    assert B == B.copy() and B.copy().give_parentheses() == B
+    assert F.copy() == F and F != F.copy().give_parentheses() / 2
+    sin, cos = Function("\\sin", 3), Function("\\cos", 3)
+    assert sin(x) != cos(x)
+    n = Integer(1)
+    R = x + n
+    h = hash(R)
+    n.n = 2
+    n.invalidate()
+    assert hash(R) != h and R == x + 2
+
+def test_tex_glyph_count():
+    from MF_Algebra.utils import tex_glyph_count
+    assert tex_glyph_count("14") == 2
+    assert tex_glyph_count("-18") == 3
+    assert tex_glyph_count("\\theta") == 1
+    assert tex_glyph_count("-0.6180\\ldots") == 10
+    assert tex_glyph_count("\\text{d}") is None
+
 def test_substitute(Q,B):
     assert Q.substitute_at_address(B, "1").is_identical_to((x/y)**B)
     assert Q.substitute_at_address(B, "01").is_identical_to((x/B)**2)
     assert Q.substitute_at_addresses(B, ["0", "1"]).is_identical_to(B**B)
     assert Q.substitute({x:0, y:0}).is_identical_to((SmZ(0)/SmZ(0))**2)
     assert ((e**x - 1)/(3*e**x + 1)).substitute({e**x:x-2}).is_identical_to(((x-2) - 1)/(3*(x-2) + 1))
+    assert (x**y).substitute({x:y, y:x}).is_identical_to(y**x)
+    assert ((x+1)**2 + x).substitute({x+1:z, x:3}).is_identical_to(z**2 + 3)
+    assert ((x+1)+1).substitute({x+1:x}).is_identical_to(x+1)
+    assert (x-(y+1)).substitute({y:-2}).is_identical_to(x-Add(-2,1))
+
+def test_substitute_shares_nothing(F):
+    G = F.substitute({y: z})
+    assert G == f(x,z,z**2-x**2) / Function("\\sin", 3)(Variable("\\theta"))
+    addresses = G.get_all_addresses()
+    assert not {id(G.get_subex(ad)) for ad in addresses} & {id(F.get_subex(ad)) for ad in F.get_all_addresses()} - {id(x), id(z)}
+
+def test_deep_expressions():
+    depth = 2 * sys.getrecursionlimit()
+    algebra_config["auto_parentheses"] = False
+    try:
+        T, C, M, N = x, Integer(1), x, Negative(y)
+        for _ in range(depth):
+            T, C, M, N = Pow(x, T), Div(1, Add(1, C)), Mul(M, x), Mul(N, x)
+    finally:
+        algebra_config["auto_parentheses"] = True
+    T.auto_parentheses()
+    assert not M.is_negative() and N.is_negative() and Mul(2, N).children[1].parentheses
+    assert M.substitute({x: -1}).is_negative()
+    assert str(T).count("^") == depth
+    assert abs(C.compute() - (5**0.5 - 1) / 2) < 1e-9
+    assert T.copy() == T and hash(T.copy()) == hash(T)
+    assert T.get_subex("1" * depth) is x
+    assert len(T.get_all_addresses()) == 2 * depth + 1
+    assert match_expressions(Pow(x, y), T)[y] is T.children[1]
+    assert T.substitute({x: z}) == T.copy().substitute({x: z})
+    assert C.reset_parentheses() == C
     
+def test_vectorize():
+    xs = np.linspace(0.5, 2, 50)
+    sin = Function("\\sin", 3, rule=np.sin)
+    double = Function("d", 1, rule=lambda t: float(t) * 2) # only takes numbers
+    E = (x + 1)**2 / 2 - x**-1 + sin(x*y) + double(y)
+    assert np.allclose(E.vectorize(x, y)(xs, xs[::-1]), (xs + 1)**2 / 2 - 1 / xs + np.sin(xs * xs[::-1]) + 2 * xs[::-1])
+    assert np.allclose(E.vectorize(x, y)(xs, 1), (xs + 1)**2 / 2 - 1 / xs + np.sin(xs) + 2)
+    assert list(Integer(3).vectorize(x)(xs)) == [3] * len(xs)
+    with pytest.raises(ValueError):
+        E.vectorize(x)
+
+def test_compile():
+    sin = Function("\\sin", 3, rule=np.sin)
+    E = (x + 1)**2 / 2 - sin(x) * 3 + x**y**2 - Negative(y) / 4
+    compiled = E.compile([x, y])
+    for values in [(1.5, 2), (2, 3), (-1, 1)]:
+        assert compiled(*values) == E.substitute({x: values[0], y: values[1]}).compute()
+    assert E.compile([x, y]) is compiled
+    assert E.compile()(2, 3) == compiled(2, 3)
+    assert E.compile([y, x])(3, 2) == compiled(2, 3)
+    E.get_subex("1").invalidate()
+    assert E.compile([x, y]) is not compiled
+    with pytest.raises(ZeroDivisionError):
+        (x / (y - 1)).compile()(1, 1)
+    A = Variable("A")
+    repeated = (A*A + A).substitute({A: x**2 + 1}) # three separate copies of x**2 + 1
+    assert repeated.compile([x]).source.count("\n") == 6 # def, x**2, +1, *, + and return
+    assert repeated.compile([x])(2) == 30 and repeated.vectorize(x)(np.array([2]))[0] == 30
+    f1 = Function("f", 1, rule=lambda t: t + 1)
+    f2 = Function("f", 1, rule=lambda t: 100 * t) # same symbol, so only the rule tells them apart
+    G = f1(2) + f2(2)
+    assert G.compute() == 203 and G.compile()() == 203 and G.vectorize()() == 203
+    with pytest.raises(ValueError):
+        E.compile([x])
+
+def test_exact_numbers():
+    from fractions import Fraction
+    E = Integer(1)/3 + Integer(1)/6 - 2**Integer(-2)
+    assert E.compute() == 0.25
+    assert E.evaluate("exact").is_identical_to(Rational(1, 4))
+    assert algebra_config["number_mode"] == "float"
+    assert (Integer(6)/3).evaluate("exact").is_identical_to(Integer(2))
+    assert (Integer(1)/3 - 1).evaluate("exact").is_identical_to(Negative(Rational(2, 3)))
+    assert Smarten(Fraction(-4, 2)).is_identical_to(Integer(-2))
+    algebra_config["number_mode"] = "exact"
+    try:
+        assert (x/3 + y).compile([x, y])(1, Fraction(1, 2)) == Fraction(5, 6)
+    finally:
+        algebra_config["number_mode"] = "float"
+
+def test_memoized_compute(B):
+    E = (Integer(2) + 3) * 4 - Integer(6) / 4
+    assert E.compute() == 18.5 and E._computed[2] == 18.5
+    assert E.copy()._computed == E._computed
+    E.get_subex("00").children[0] = Integer(4)
+    E.get_subex("00").invalidate()
+    assert E._computed is None and E.compute() == 26.5
+    assert E.evaluate("exact").is_identical_to(Rational(53, 2))
+    with pytest.raises(ValueError):
+        B.compute()
+    with pytest.raises(ValueError):
+        B.compute()
+    assert B.free_variables == {x, y} and B.get_subex("00010").free_variables == {x}
+    assert not B.is_constant and E.is_constant
+    assert (x * (Integer(2) + 3) + 1 / (Integer(4) - 4)).fold_constants().is_identical_to(x * 5 + 1 / Integer(0))
+
+def test_evaluate_many():
+    double = Function("d", 1, rule=lambda t: float(t) * 2) # only takes numbers
+    expressions = [
+        (Integer(2) + 3) * 4,
+        (Integer(1) + 5) * Integer(7) / 2,
+        Integer(1) / (Integer(3) - 3),
+        Integer(10) ** 400 + 1,
+        x + 1,
+        double(Integer(3)) - 1,
+        Equation(Integer(1), Integer(1)),
+        7,
+    ]
+    values, errors = evaluate_many(expressions)
+    assert list(values[[0, 1, 5, 7]]) == [20, 21, 5, 7]
+    assert np.isnan(values[[2, 3, 4, 6]]).all()
+    assert [type(error) for error in errors] == [type(None), type(None), ZeroDivisionError, OverflowError, ValueError, type(None), ValueError, type(None)]
+    assert evaluate_many([])[1] == []
+    f1 = Function("f", 1, rule=lambda t: t + 1)
+    f2 = Function("f", 1, rule=lambda t: 100 * t) # same symbol, so only the rule tells them apart
+    assert list(evaluate_many([f1(2), f2(2)])[0]) == [3, 200]
+    values, errors = evaluate_many([Integer(2) + 3, Sequence(1, 2), Add(Sequence(1, 2), 3), 4])
+    assert list(values[[0, 3]]) == [5, 4] and np.isnan(values[[1, 2]]).all()
+    assert errors[0] is None and errors[3] is None and isinstance(errors[1], ValueError) and isinstance(errors[2], ValueError)
+
 def _disable_test_nest():
     Nl, Nr = SmZ(1), SmZ(1)
     for i in range(2,9):
@@ -0,0 +1,123 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from manimlib import *
+from MF_Algebra.expressions import *
+from MF_Algebra.rendering import *
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TexCache(str(tmp_path), max_bytes=2**20)
+
+
+def test_tex_cache_roundtrip(cache):
+    points = [np.zeros((3,3)), np.ones((6,3))]
+    assert cache.get("x^2") is None
+    cache.put("x^2", points)
+    cached = cache.get("x^2")
+    assert len(cached) == 2
+    assert all(np.array_equal(a, b) for a, b in zip(cached, points))
+    assert cache.get("x^3") is None
+
+def test_tex_cache_eviction(cache):
+    for i in range(10):
+        cache.put(str(i), [np.zeros((100,3))])
+    cache.max_bytes = 1
+    cache.evict()
+    assert all(cache.get(str(i)) is None for i in range(10))
+
+def test_cached_mob_indexes_like_tex(tmp_path):
+    algebra_config["tex_cache"] = True
+    algebra_config["tex_cache_dir"] = str(tmp_path)
+    try:
+        Q = (x/y)**2
+        first = Q.mob
+        Q2 = (x/y)**2
+        assert len(get_glyph_points(Q2.mob)) == len(get_glyph_points(first)) == len(Q)
+    finally:
+        algebra_config["tex_cache"] = False
+        algebra_config["tex_cache_dir"] = None
+
+def test_tex_cache_dir_reset(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    algebra_config["tex_cache"] = True
+    algebra_config["tex_cache_dir"] = str(tmp_path / "custom")
+    try:
+        assert get_tex_cache().directory == str(tmp_path / "custom")
+        algebra_config["tex_cache_dir"] = None
+        assert get_tex_cache().directory == get_default_tex_cache_dir() == str(tmp_path / "home" / ".cache" / "MF_Algebra" / "tex")
+    finally:
+        algebra_config["tex_cache"] = False
+        algebra_config["tex_cache_dir"] = None
+
+def test_compile_many():
+    Q = (x/y)**2
+    B = (2*x+y)/(x-25*y**3)
+    compile_many([Q, B, None])
+    assert Q._mob is not None and B._mob is not None
+    assert len(get_glyph_points(Q.mob)) == len(Q)
+    assert len(get_glyph_points(B.mob)) == len(B)
+
+def test_compile_many_bad_paren_count(monkeypatch):
+    from MF_Algebra.rendering import tex_batch
+    from MF_Algebra.expressions import expression_core
+    monkeypatch.setattr(expression_core, "paren_length_cache", {})
+    compile_tex_strings = tex_batch.compile_tex_strings
+    def drop_a_paren_glyph(strings):
+        compiled = compile_tex_strings(strings)
+        return {string: points[:-1] if string.startswith("\\left(") else points for string, points in compiled.items()}
+    monkeypatch.setattr(tex_batch, "compile_tex_strings", drop_a_paren_glyph)
+    Q = (x/y)**2
+    compile_many([Q])
+    assert expression_core.paren_length_cache == {}
+    assert Q.get_subex("0").paren_length() == 1
+
+def test_incremental_rendering():
+    algebra_config["incremental_rendering"] = True
+    try:
+        S = Add(*range(1,10)) - x/(y+1) + Sub(3, x**2)
+        assert len(get_glyph_points(S.mob)) == len(S)
+        T = Add(*range(1,10)) - x/(y+2) + Sub(3, x**2)
+        assert len(get_glyph_points(T.mob)) == len(T)
+    finally:
+        algebra_config["incremental_rendering"] = False
+
+def test_incremental_rendering_positions():
+    def centered(mob):
+        glyph_points = get_glyph_points(mob)
+        all_points = np.concatenate(glyph_points)
+        return [points - (all_points.max(axis=0) + all_points.min(axis=0)) / 2 for points in glyph_points]
+    string = Add(1, x).get_tex_string()
+    if not np.allclose(np.concatenate(centered(compile_tex(string))), np.concatenate(centered(compile_tex(string)))):
+        pytest.skip("Tex is not deterministic here, so there are no positions to compare")
+    algebra_config["incremental_rendering"] = True
+    try:
+        for S in [Add(1, x, Div(y, z)), Add(-x, y, 2)]:
+            assembled = centered(S.mob)
+            compiled = centered(compile_tex(S.get_tex_string()))
+            assert len(assembled) == len(compiled)
+            for a, c in zip(assembled, compiled):
+                assert np.allclose(a, c, atol=1e-2)
+    finally:
+        algebra_config["incremental_rendering"] = False
+
+def test_profile(tmp_path):
+    algebra_config["tex_cache"] = True
+    algebra_config["tex_cache_dir"] = str(tmp_path)
+    try:
+        with profile() as p:
+            (x+y).mob
+            (x+y).mob
+            B = (2*x+y)/(x-25*y**3)
+            B.set_color_by_subex({x: "#FF0000"})
+        assert p.cache_hits >= 1 and p.cache_misses >= 2
+        assert p.compiles == p.cache_misses
+        sites = {row["site"] for row in p.summary()}
+        assert "Add.init_mob" in sites
+        assert "Div.set_color_by_subex" in sites
+        assert '"compiles"' in p.to_json() and "total" in p.table()
+    finally:
+        algebra_config["tex_cache"] = False
+        algebra_config["tex_cache_dir"] = None
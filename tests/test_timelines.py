@@ -49,3 +49,31 @@ def test_create_with_rshift(A, B, Q, s, a):
 
 
 
+
+
+def test_prefetch(Q, s):
+    class DummyScene:
+        def __init__(self):
+            self.played = []
+        def play(self, animation):
+            self.played.append(animation)
+    T = Timeline(prefetch=2) >> Q >> s
+    T = T >> s >> s
+    scene = DummyScene()
+    T.play_next(scene)
+    assert set(T.prefetched.keys()) == {1, 2}
+    T.prefetched[2].result()
+    assert [i for i in range(4) if T.get_expression(i)._mob is None or T.get_expression(i)._glyph_index is None] == []
+    T.play_next(scene)
+    T.play_next(scene)
+    assert len(scene.played) == 3 and T.prefetched == {}
+    T.play_animation(scene, 0)
+    pending = T.prefetched[1]
+    T >> s
+    assert pending.done() and T.prefetched == {}
+
+def test_evaluate_exact():
+    T = Evaluate(Integer(1)/3 + Integer(1)/3*Integer(3)/7 + 2**Integer(-1), number_mode="exact")
+    assert T.get_expression(len(T.steps)-1).is_identical_to(Rational(41, 42))
+    T = Evaluate(2*x + Integer(6)/4, number_mode="exact")
+    assert T.get_expression(len(T.steps)-1).is_identical_to(2*x + Rational(3, 2))
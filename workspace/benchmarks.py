@@ -0,0 +1,120 @@
+import sys
+import os
+import time
+import timeit
+import tracemalloc
+
+# Add the src directory to the sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from MF_Algebra import *
+
+
+def build_polynomial(n=9):
+	# n terms (at most 9, since addresses take one digit per level) like 3x^2, with all the usual leaves and operations
+	return Add(*[Mul(k, Pow(x, k % 5)) for k in range(1, n+1)]) / (y - Integer(n))
+
+
+def build_large(n=9):
+	# Around 500 nodes
+	return Add(*[build_polynomial() for _ in range(n)])
+
+
+def count_nodes(expr):
+	return len(expr.get_all_addresses())
+
+
+def memory_per_node(build, repeats=200):
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+	exprs = [build() for _ in range(repeats)]
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+	allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+	return allocated / (repeats * count_nodes(exprs[0]))
+
+
+def node_size(expr):
+	# The nodes themselves, not counting children lists or other shared objects. Before __slots__ this included a __dict__.
+	sizes = [sys.getsizeof(subex) + sys.getsizeof(getattr(subex, "__dict__", {})) for subex in map(expr.get_subex, expr.get_all_addresses())]
+	return sum(sizes) / len(sizes)
+
+
+def construction_time(build, number=2000):
+	return min(timeit.repeat(build, number=number, repeat=5)) / number
+
+
+def lookup_time(expr, subex, number=200):
+	return min(timeit.repeat(lambda: expr.get_addresses_of_subex(subex), number=number, repeat=5)) / number
+
+
+def build_deep(depth, step):
+	# Nests step(inner) depth times. Parentheses are left off while building, which would otherwise
+	# go over the whole expression at every level, and added in one walk at the end.
+	algebra_config["auto_parentheses"] = False
+	try:
+		expr = Integer(1)
+		for _ in range(depth):
+			expr = step(expr)
+	finally:
+		algebra_config["auto_parentheses"] = True
+	return expr.auto_parentheses()
+
+
+deep_shapes = {
+	"power tower": lambda inner: Pow(x, inner),
+	"continued fraction": lambda inner: Div(1, Add(1, inner)),
+	"nested radical": lambda inner: Pow(Add(2, inner), Div(1, 2)),
+	"product chain": lambda inner: Mul(inner, 2),
+}
+
+deep_walks = {
+	"str": lambda expr, twin: str(expr),
+	"hash": lambda expr, twin: hash(expr),
+	"compare": lambda expr, twin: expr.is_identical_to(twin),
+	"copy": lambda expr, twin: expr.copy(),
+	"addresses": lambda expr, twin: expr.get_all_addresses(),
+	"parentheses": lambda expr, twin: expr.reset_parentheses(),
+	"match": lambda expr, twin: match_expressions(expr, twin),
+	"substitute": lambda expr, twin: expr.substitute({1: 2}),
+	"compute": lambda expr, twin: expr.compute(),
+}
+
+
+def deep_walk_time(walk, shape, depth, repeat=3):
+	# Each run gets freshly built expressions, so nothing cached by one run helps the next
+	times = []
+	for _ in range(repeat):
+		expr, twin = build_deep(depth, deep_shapes[shape]), build_deep(depth, deep_shapes[shape])
+		start = time.perf_counter()
+		walk(expr, twin)
+		times.append(time.perf_counter() - start)
+	return min(times)
+
+
+def deep_walk_table(depths=(10, 100, 1000, 5000)):
+	# Microseconds per node for each walk at each depth, which stays flat if the walk is linear.
+	# A power tower of x can't be computed. The strings made by str are nested in each other, so their total length,
+	# and with it the time per node, grows with the depth.
+	rows = []
+	for shape in deep_shapes:
+		for name, walk in deep_walks.items():
+			if name == "compute" and shape == "power tower":
+				continue
+			nodes = [count_nodes(build_deep(depth, deep_shapes[shape])) for depth in depths]
+			rows.append((shape, name, [deep_walk_time(walk, shape, depth) / n * 1e6 for depth, n in zip(depths, nodes)]))
+	return rows
+
+
+if __name__ == "__main__":
+	P = build_polynomial()
+	print(f"nodes per expression:        {count_nodes(P)}")
+	print(f"memory per node:             {memory_per_node(build_polynomial):.0f} bytes allocated")
+	print(f"size of each node:           {node_size(P):.0f} bytes")
+	print(f"construction time:           {construction_time(build_polynomial)*1e6:.0f} us per expression")
+	L = build_large()
+	print(f"finding x in {count_nodes(L)} nodes:      {lookup_time(L, x)*1e6:.0f} us")
+
+	depths = (10, 100, 1000, 5000)
+	print(f"\nus per node at depth {', '.join(map(str, depths))} (recursion limit {sys.getrecursionlimit()})")
+	for shape, name, times in deep_walk_table(depths):
+		print(f"{shape:>20} {name:<12}" + "".join(f"{t:10.2f}" for t in times))